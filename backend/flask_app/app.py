@@ -1,16 +1,53 @@
 # flask_app/app.py
+import hmac
 import os
 import uuid
 import json
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import redis
-from celery_worker import run_crew_task
+from celery_worker import fair_queue, result_cache, run_batch_task, run_crew_task
+from fair_queue import BULK, INTERACTIVE
+from checkpoints import JobStageRecord
+from stage_cache import StageCache
+from single_flight import claim, job_fingerprint, recent_job
+from job_events import TERMINAL_STATUSES, format_sse, job_channel, publish_status
+from metrics import render_prometheus
+from status_api import (
+    encode,
+    etag,
+    etag_matches,
+    multi_status_body,
+    parse_fields,
+    parse_ids,
+    project,
+    status_key,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
-r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# bounded: past this many connections requests wait for a free one
+REDIS_MAX_CONNECTIONS = int(os.environ.get("API_REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = 5
+r = redis.Redis(
+    connection_pool=redis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    )
+)
+# /job-events holds a connection per open stream for as long as it lasts,
+# so its subscriptions get their own unbounded pool instead of starving
+# the other routes of the bounded one
+subscriber_r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+stage_cache = StageCache(r)
+SSE_HEARTBEAT_SECONDS = 15
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 30))
+# shared with the Next.js API routes: only requests carrying it in
+# X-Proxy-Secret may name the user in X-User-Id (unset: nobody may)
+API_PROXY_SECRET = os.environ.get("API_PROXY_SECRET", "")
 app = Flask(__name__)
 
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -21,7 +58,49 @@ def set_status(job_id, status, payload=None):
     data = {"status": status}
     if payload is not None:
         data["payload"] = payload
-    r.set(key, json.dumps(data), ex=60 * 60 * 24)  # keep 24 hours (adjust)
+    r.set(key, encode(data), ex=60 * 60 * 24)  # keep 24 hours (adjust)
+    publish_status(r, job_id, data)
+
+
+def get_status(job_id):
+    raw = r.get(status_key(job_id))
+    return json.loads(raw) if raw else None
+
+
+def request_user() -> str:
+    """
+    Whom a job is queued for, for the fair-share scheduling: the signed-in
+    user the Next.js proxy names in X-User-Id, trusted only alongside the
+    proxy secret. Other callers are told apart by their address.
+    """
+    user = request.headers.get("X-User-Id")
+    secret = request.headers.get("X-Proxy-Secret", "")
+    if (
+        user
+        and API_PROXY_SECRET
+        and hmac.compare_digest(secret.encode(), API_PROXY_SECRET.encode())
+    ):
+        return f"user:{user}"
+    return f"addr:{request.remote_addr or ''}"
+
+
+def signed_in(user: str) -> bool:
+    """
+    Whether request_user named one person. An address may be the Next.js
+    proxy relaying everyone (no API_PROXY_SECRET set), so its jobs are not
+    held to the per-user cap.
+    """
+    return user.startswith("user:")
+
+
+def conditional_json(body: str) -> Response:
+    """
+    JSON response with an ETag, or 304 when the client already has it.
+    """
+    headers = {"ETag": f'"{etag(body)}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag(body)):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
 
 
 @app.route("/start-job", methods=["POST"])
@@ -29,30 +108,254 @@ def start_job():
     body = request.get_json(force=True)
     pdf_url = body.get("pdf_url")
     text = body.get("text")
+    # force a fresh run instead of reusing an earlier result
+    bypass_cache = bool(body.get("bypass_cache"))
 
     if not pdf_url or text is None:
         return jsonify({"error": "pdf_url and text are required"}), 400
 
+    fingerprint = job_fingerprint(pdf_url, text)
+
+    if not bypass_cache:
+        # identical job finished recently → hand back its result
+        recent_id = recent_job(r, fingerprint)
+        if recent_id:
+            recent = get_status(recent_id)
+            if recent and recent["status"] == "completed":
+                return jsonify({"job_id": recent_id, **recent}), 200
+
+        # same resume URL and JD tailored before → complete from the result cache
+        cached = result_cache.get_by_url(pdf_url, text)
+        if cached is not None:
+            job_id = uuid.uuid4().hex
+            set_status(job_id, "completed", cached)
+            return (
+                jsonify({"job_id": job_id, "status": "completed", "payload": cached}),
+                200,
+            )
+
     job_id = uuid.uuid4().hex
+    existing_id = claim(r, fingerprint, job_id)
+    if existing_id:
+        existing = get_status(existing_id)
+        # identical job still queued/running → attach to it
+        if existing and existing["status"] in ("queued", "running"):
+            return jsonify({"job_id": existing_id, "status": existing["status"]}), 202
+        # the holder failed or expired, take over its claim
+        claim(r, fingerprint, job_id, force=True)
+
     set_status(job_id, "queued")
     # enqueue the task asynchronously
-    run_crew_task.delay(job_id, pdf_url, text)
+    user = request_user()
+    fair_queue.submit(
+        job_id,
+        user,
+        INTERACTIVE,
+        run_crew_task.name,
+        [job_id, pdf_url, text],
+        {"bypass_cache": bypass_cache, "user": user},
+        capped=signed_in(user),
+    )
     return jsonify({"job_id": job_id, "status": "queued"}), 202
 
 
-@app.route("/job-status", methods=["GET"])
+@app.route("/retailor", methods=["POST"])
+def retailor():
+    """
+    Re-tailors a finished job after an edit: {"job_id": ..., "text": ...,
+    "pdf_url": ...}, where a missing text or pdf_url keeps the earlier one.
+    Only the stages whose inputs changed run again; the new job's payload
+    lists the reused and rerun stages under "retailor".
+    """
+    body = request.get_json(force=True)
+    previous_job = body.get("job_id")
+    bypass_cache = bool(body.get("bypass_cache"))
+    if not previous_job:
+        return jsonify({"error": "job_id required"}), 400
+
+    previous = JobStageRecord(r, previous_job).request()
+    if previous is None:
+        return jsonify({"error": "job not found or too old to re-tailor"}), 404
+    pdf_url = body.get("pdf_url") or previous["pdf_url"]
+    text = body.get("text")
+    if text is None:
+        text = previous["text"]
+
+    job_id = uuid.uuid4().hex
+    set_status(job_id, "queued", {"retailor_of": previous_job})
+    user = request_user()
+    fair_queue.submit(
+        job_id,
+        user,
+        INTERACTIVE,
+        run_crew_task.name,
+        [job_id, pdf_url, text],
+        {"bypass_cache": bypass_cache, "previous_job": previous_job, "user": user},
+        capped=signed_in(user),
+    )
+    return (
+        jsonify({"job_id": job_id, "status": "queued", "retailor_of": previous_job}),
+        202,
+    )
+
+
+@app.route("/start-batch", methods=["POST"])
+def start_batch():
+    """
+    Tailors one resume to many job descriptions in a single job:
+    {"pdf_url": ..., "texts": [...]}. Each text gets its own job id, in
+    order; the batch id reports progress across all of them.
+    """
+    body = request.get_json(force=True)
+    pdf_url = body.get("pdf_url")
+    texts = body.get("texts")
+    bypass_cache = bool(body.get("bypass_cache"))
+
+    if (
+        not pdf_url
+        or not isinstance(texts, list)
+        or not texts
+        or not all(isinstance(t, str) for t in texts)
+    ):
+        return jsonify({"error": "pdf_url and a list of texts are required"}), 400
+    if len(texts) > BATCH_MAX_ITEMS:
+        return (
+            jsonify({"error": f"at most {BATCH_MAX_ITEMS} texts per batch"}),
+            400,
+        )
+
+    batch_id = uuid.uuid4().hex
+    items = [[uuid.uuid4().hex, text] for text in texts]
+    job_ids = [job_id for job_id, _ in items]
+    for job_id in job_ids:
+        set_status(job_id, "queued", {"batch_id": batch_id})
+    set_status(
+        batch_id, "queued", {"items": job_ids, "counts": {"queued": len(job_ids)}}
+    )
+
+    # a batch weighs as much as its items in the user's fair share
+    user = request_user()
+    fair_queue.submit(
+        batch_id,
+        user,
+        BULK,
+        run_batch_task.name,
+        [batch_id, pdf_url, items],
+        {"bypass_cache": bypass_cache, "user": user},
+        cost=len(items),
+        capped=signed_in(user),
+    )
+    return jsonify({"batch_id": batch_id, "status": "queued", "jobs": job_ids}), 202
+
+
+@app.route("/batch-status", methods=["GET"])
+def batch_status():
+    batch_id = request.args.get("batch_id")
+    if not batch_id:
+        return jsonify({"error": "batch_id required"}), 400
+
+    data = get_status(batch_id)
+    if not data or "items" not in data.get("payload", {}):
+        return jsonify({"status": "unknown"}), 404
+
+    job_ids = data["payload"]["items"]
+    records = r.mget([f"job:{job_id}" for job_id in job_ids])
+    data["items"] = [
+        {"job_id": job_id, **(json.loads(raw) if raw else {"status": "unknown"})}
+        for job_id, raw in zip(job_ids, records)
+    ]
+    return conditional_json(encode(data))
+
+
+@app.route("/job-status", methods=["GET", "POST"])
 def job_status():
+    """
+    One job (?job_id=) or many (?job_ids=a,b or POST {"job_ids": [...]}),
+    the latter read with a single MGET. ?fields=status,stage trims the
+    records. A single queued job also gets "queue" (tier, position, ETA).
+    Responses carry an ETag for If-None-Match polling.
+    """
+    fields = parse_fields(request.args.get("fields"))
+    job_id = request.args.get("job_id")
+    if job_id and request.method == "GET":
+        raw = r.get(status_key(job_id))
+        if raw is None:
+            return jsonify({"status": "unknown"}), 404
+        data = json.loads(raw)
+        if data["status"] == "queued":
+            # where the job stands in the fair queue, and a rough ETA
+            raw = encode({**data, "queue": fair_queue.position(job_id)})
+        return conditional_json(project(raw, fields))
+
+    values = request.args.getlist("job_ids")
+    body = request.get_json(silent=True) if request.method == "POST" else None
+    if isinstance(body, dict) and isinstance(body.get("job_ids"), list):
+        values += body["job_ids"]
+    if not values:
+        return jsonify({"error": "job_id or job_ids required"}), 400
+    try:
+        job_ids = parse_ids(values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    records = r.mget([status_key(job_id) for job_id in job_ids])
+    return conditional_json(multi_status_body(job_ids, records, fields))
+
+
+@app.route("/job-events", methods=["GET"])
+def job_events():
+    """
+    Server-Sent Events stream of a job's status records: the current one
+    first, then every update the worker publishes until the job finishes.
+    """
     job_id = request.args.get("job_id")
     if not job_id:
         return jsonify({"error": "job_id required"}), 400
 
-    key = f"job:{job_id}"
-    raw = r.get(key)
-    if not raw:
-        return jsonify({"status": "unknown"}), 404
+    def stream():
+        pubsub = subscriber_r.pubsub(ignore_subscribe_messages=True)
+        # subscribe before reading the snapshot so no update slips between
+        pubsub.subscribe(job_channel(job_id))
+        try:
+            data = get_status(job_id) or {"status": "unknown"}
+            yield format_sse(encode(data))
+            if data["status"] in TERMINAL_STATUSES + ("unknown",):
+                return
+
+            while True:
+                message = pubsub.get_message(timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield format_sse(message["data"])
+                if json.loads(message["data"])["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            pubsub.close()
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    # the full-pipeline result cache reports under "pipeline"
+    return jsonify({**stage_cache.stats(), **result_cache.cache.stats()}), 200
+
 
-    data = json.loads(raw)
-    return jsonify(data), 200
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, token
+    counters and job outcomes aggregated across all workers.
+    """
+    return Response(
+        render_prometheus(r), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 if __name__ == "__main__":
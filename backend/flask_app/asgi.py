@@ -0,0 +1,256 @@
+# flask_app/asgi.py
+# Production serving mode for the API:
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+#
+# The polling paths (/job-status, /batch-status, /job-events) are served
+# natively async over a bounded Redis pool, so thousands of idle pollers
+# and SSE streams cost a coroutine each instead of a thread. Every other
+# route is the Flask app, run on a thread pool.
+import asyncio
+import contextlib
+import json
+import os
+
+import redis.asyncio as aioredis
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import REDIS_URL, SSE_HEARTBEAT_SECONDS
+from app import app as flask_app
+from fair_queue import JOBS_KEY, POSITION_SCRIPT, queue_entry, tier_keys
+from job_events import TERMINAL_STATUSES, format_sse, job_channel
+from status_api import (
+    encode,
+    etag,
+    etag_matches,
+    multi_status_body,
+    parse_fields,
+    parse_ids,
+    project,
+    status_key,
+)
+
+# per process; requests wait for a free connection past this
+ASYNC_REDIS_MAX_CONNECTIONS = int(os.environ.get("ASYNC_REDIS_MAX_CONNECTIONS", 100))
+ASYNC_REDIS_POOL_TIMEOUT = 5
+# threads running the Flask routes (job submission, metrics)
+WSGI_THREADS = int(os.environ.get("API_WSGI_THREADS", 16))
+# status records buffered per SSE client; older ones are dropped first
+SSE_QUEUE_SIZE = 16
+
+
+def redis_client() -> aioredis.Redis:
+    pool = aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=ASYNC_REDIS_MAX_CONNECTIONS,
+        timeout=ASYNC_REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+class EventHub:
+    """
+    One pattern subscription per process, fanned out to the SSE clients
+    of each job, instead of a Redis connection per open stream.
+    """
+
+    def __init__(self, r):
+        self.r = r
+        self.listeners = {}
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    def listen(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.listeners.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def forget(self, job_id: str, queue: asyncio.Queue) -> None:
+        queues = self.listeners.get(job_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.listeners[job_id]
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        job_id = channel[len(job_channel("")) :]
+        for queue in self.listeners.get(job_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self.r.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.psubscribe(job_channel("*"))
+                    async for message in pubsub.listen():
+                        if message["type"] == "pmessage":
+                            self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Redis went away; SSE clients keep their heartbeats meanwhile
+                await asyncio.sleep(1)
+
+
+def json_error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def conditional_json(request, body: str) -> Response:
+    """
+    JSON response with an ETag, or 304 when the client already has it.
+    """
+    tag = etag(body)
+    headers = {"ETag": f'"{tag}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def job_status(request):
+    """
+    Same contract as the Flask route: ?job_id= for one job, ?job_ids=a,b or
+    POST {"job_ids": [...]} for many, read with a single MGET.
+    """
+    r = request.app.state.redis
+    fields = parse_fields(request.query_params.get("fields"))
+    job_id = request.query_params.get("job_id")
+    if job_id and request.method == "GET":
+        raw = await r.get(status_key(job_id))
+        if raw is None:
+            return JSONResponse({"status": "unknown"}, status_code=404)
+        data = json.loads(raw)
+        if data["status"] == "queued":
+            position, queued = None, await r.hget(JOBS_KEY, job_id)
+            if queued:
+                keys = tier_keys(json.loads(queued)["tier"])
+                position = await r.eval(POSITION_SCRIPT, len(keys), *keys, job_id)
+            raw = encode({**data, "queue": queue_entry(position)})
+        return conditional_json(request, project(raw, fields))
+
+    values = request.query_params.getlist("job_ids")
+    if request.method == "POST":
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and isinstance(body.get("job_ids"), list):
+            values += body["job_ids"]
+    if not values:
+        return json_error("job_id or job_ids required", 400)
+    try:
+        job_ids = parse_ids(values)
+    except ValueError as e:
+        return json_error(str(e), 400)
+
+    records = await r.mget([status_key(job_id) for job_id in job_ids])
+    return conditional_json(request, multi_status_body(job_ids, records, fields))
+
+
+async def batch_status(request):
+    r = request.app.state.redis
+    batch_id = request.query_params.get("batch_id")
+    if not batch_id:
+        return json_error("batch_id required", 400)
+
+    raw = await r.get(status_key(batch_id))
+    data = json.loads(raw) if raw else None
+    if not data or "items" not in data.get("payload", {}):
+        return JSONResponse({"status": "unknown"}, status_code=404)
+
+    job_ids = data["payload"]["items"]
+    records = await r.mget([status_key(job_id) for job_id in job_ids])
+    data["items"] = [
+        {"job_id": job_id, **(json.loads(raw) if raw else {"status": "unknown"})}
+        for job_id, raw in zip(job_ids, records)
+    ]
+    return conditional_json(request, encode(data))
+
+
+async def job_events(request):
+    """
+    Server-Sent Events stream of a job's status records, fed by the
+    process-wide EventHub.
+    """
+    r = request.app.state.redis
+    hub = request.app.state.events
+    job_id = request.query_params.get("job_id")
+    if not job_id:
+        return json_error("job_id required", 400)
+
+    async def stream():
+        # listen before reading the snapshot so no update slips between
+        queue = hub.listen(job_id)
+        try:
+            raw = await r.get(status_key(job_id)) or '{"status":"unknown"}'
+            yield format_sse(raw)
+            if json.loads(raw)["status"] in TERMINAL_STATUSES + ("unknown",):
+                return
+
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield format_sse(data)
+                if json.loads(data)["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            hub.forget(job_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # created inside the event loop the connections will belong to
+    app.state.redis = redis_client()
+    app.state.events = EventHub(app.state.redis)
+    app.state.events.start()
+    try:
+        yield
+    finally:
+        await app.state.events.stop()
+        await app.state.redis.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/job-status", job_status, methods=["GET", "POST"]),
+        Route("/batch-status", batch_status),
+        Route("/job-events", job_events),
+        Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["ETag"],
+        )
+    ],
+    lifespan=lifespan,
+)
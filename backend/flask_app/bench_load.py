@@ -0,0 +1,609 @@
+# flask_app/bench_load.py
+"""
+Offline load test for the whole job path.
+
+Jobs go through /start-job (Flask test client) → the fair queue →
+run_crew_task in forked worker processes (one job at a time each, like
+Celery prefork children) → run_agent → compile → upload, with these
+stand-ins:
+
+  * a deterministic stub LLM with configurable latency (no OpenAI calls),
+  * an in-process fakeredis server shared over TCP, or --redis-url,
+  * a local, content-addressed artifact directory instead of Supabase and
+    Cloudinary,
+  * a stub pdflatex when pdflatex is not installed (or --latex stub).
+
+Resumes and JDs are replayed from bench_corpus.json. Reports jobs/sec,
+end-to-end and per-stage p50/p95/p99 (from the job records' metrics) and
+peak worker memory. With --heavy-share, one user bursts that share of the
+jobs up front and end-to-end latency is reported for it and the rest apart.
+--routing picks the model routing policy; the report counts the models
+each stage was routed to and the estimated LLM cost, and the stub answers
+faster on the small model.
+
+    python bench_load.py --jobs 40 --workers 4 --llm-latency 0.5
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(HERE, "bench_corpus.json")
+HEAVY_USER = "bench-heavy"
+# plays the Next.js proxy, which names the signed-in user to the API
+PROXY_SECRET = "bench-proxy"
+TERMINAL = ("completed", "failed")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=20, help="jobs to replay")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="job arrivals per second (0 submits everything at once)",
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="seconds per stub LLM call"
+    )
+    parser.add_argument(
+        "--llm-jitter",
+        type=float,
+        default=0.2,
+        help="± fraction of --llm-latency, derived from the prompt hash",
+    )
+    parser.add_argument(
+        "--latex",
+        choices=("auto", "real", "stub"),
+        default="auto",
+        help="auto uses pdflatex when it is installed",
+    )
+    parser.add_argument(
+        "--latex-latency", type=float, default=0.3, help="seconds per stub pass"
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="disable the stage cache so every job runs every LLM stage",
+    )
+    parser.add_argument(
+        "--llm-limits",
+        default="{}",
+        help="LLM_RATE_LIMITS JSON for the shared scheduler, e.g. "
+        '\'{"openai/gpt-4o": {"rpm": 500, "tpm": 30000}}\' (default: unlimited)',
+    )
+    parser.add_argument(
+        "--users", type=int, default=4, help="distinct users submitting jobs"
+    )
+    parser.add_argument(
+        "--heavy-share",
+        type=float,
+        default=0,
+        help="fraction of the jobs one heavy user submits first",
+    )
+    parser.add_argument(
+        "--routing",
+        default="tiered",
+        help="model routing policy from config/routing.yaml",
+    )
+    parser.add_argument("--redis-url", help="use this Redis instead of fakeredis")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", dest="json_path", help="also write the report here")
+    return parser.parse_args(argv)
+
+
+# ---------------- environment ----------------
+
+
+def start_fake_redis():
+    try:
+        import lupa  # noqa: F401  (Lua scripting for the single-flight and rate limits)
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        sys.exit("fakeredis[lua]>=2.24 is required without --redis-url")
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    # connection handlers must not keep the process alive on exit
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"redis://{host}:{port}/0"
+
+
+def prepare_env(
+    redis_url: str, scratch: str, llm_limits: str = "{}", routing: str = "tiered"
+) -> None:
+    """
+    Points every module at local stand-ins. Must run before they are
+    imported, since they read their settings at import time.
+    """
+    os.environ["REDIS_URL"] = redis_url
+    os.environ["BROKER_URL"] = redis_url
+    os.environ["BACKEND_URL"] = redis_url
+    os.environ["WORKSPACE_ROOT"] = os.path.join(scratch, "workspaces")
+    os.environ["LATEX_FORMAT_DIR"] = os.path.join(scratch, "formats")
+    os.environ["PDF_INDEX_DIR"] = os.path.join(scratch, "pdf_index")
+    os.environ["RESUME_TAILOR_VERBOSE"] = "0"
+    os.environ["LLM_RATE_LIMITS"] = llm_limits
+    os.environ["RESUME_TAILOR_ROUTING"] = routing
+    os.environ["API_PROXY_SECRET"] = PROXY_SECRET
+    os.environ["CREWAI_DISABLE_TELEMETRY"] = "true"
+    os.environ["OTEL_SDK_DISABLED"] = "true"
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["SUPABASE_URL"] = "http://supabase.invalid"
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "bench"
+    os.environ.setdefault("CLOUDINARY_CLOUD_NAME", "bench")
+
+
+# ---------------- corpus ----------------
+
+
+def text_pdf(lines) -> bytes:
+    """
+    Minimal single-page PDF with one line of Helvetica per entry, enough
+    for PyPDF2 to extract the text back.
+    """
+
+    def esc(s):
+        s = s.encode("latin-1", "replace").decode("latin-1")
+        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+        f"({esc(line)}) '" for line in lines
+    )
+    stream += " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    return out
+
+
+def resume_lines(resume) -> list:
+    h = resume.header
+    lines = [h.name, " | ".join(filter(None, [h.email, h.phone, h.location]))]
+    lines += h.links
+    if resume.summary:
+        lines += ["", "SUMMARY", resume.summary]
+    lines += ["", "SKILLS"]
+    lines += [f"{g.category}: {', '.join(g.items)}" for g in resume.skills]
+    lines += ["", "EXPERIENCE"]
+    for e in resume.experience:
+        lines.append(f"{e.title}, {e.organization} ({e.dates or ''})")
+        lines += [f"- {b}" for b in e.bullets]
+    lines += ["", "PROJECTS"]
+    for p in resume.projects:
+        lines.append(f"{p.name} ({p.technologies or ''})")
+        lines += [f"- {b}" for b in p.bullets]
+    lines += ["", "EDUCATION"]
+    for ed in resume.education:
+        lines.append(f"{ed.degree or ''}, {ed.institution} ({ed.dates or ''})")
+    lines += [f"Certification: {c}" for c in resume.certifications]
+    return lines
+
+
+def load_corpus(path: str, scratch: str):
+    """
+    Parsed sample resumes, their PDFs written under `scratch`, and the JDs.
+    """
+    from resume_tailor.schema import TailoredResume
+
+    with open(path, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    resumes, pdf_paths = [], []
+    pdf_dir = os.path.join(scratch, "resumes")
+    os.makedirs(pdf_dir, exist_ok=True)
+    for i, raw in enumerate(corpus["resumes"]):
+        resume = TailoredResume.model_validate(raw)
+        pdf_path = os.path.join(pdf_dir, f"resume-{i}.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(text_pdf(resume_lines(resume)))
+        resumes.append(resume)
+        pdf_paths.append(pdf_path)
+    return resumes, pdf_paths, corpus["jds"]
+
+
+# ---------------- stand-ins ----------------
+
+STUB_ANSWER = "Thought: I now know the final answer\nFinal Answer: {}"
+# stub latency per routed model, relative to --llm-latency
+MODEL_LATENCY = {"openai/gpt-4o-mini": 0.5}
+# capitalised words past the first of a requirement line ("Flask", "AWS")
+_TECH_RE = re.compile(r"(?<=\s)[A-Z][\w+#.]*")
+_PDF_PATH_RE = re.compile(r"(/[^\s\"']+\.pdf)")
+
+
+def install_stub_llm(resumes, latency: float, jitter: float) -> None:
+    """
+    Replaces the completion call every crew LLM ends in. Answers depend
+    only on the task and the prompt, and usage is reported through the
+    same callbacks a real completion feeds, so token metrics still work.
+    """
+    from crewai.llm import LLM
+    from litellm import Usage
+    from resume_tailor.latex_renderer import render_resume
+    from resume_tailor.routing import current_route
+    from resume_tailor.tools.pdf_search_tool import extract_pdf_text
+
+    def pick_resume(prompt: str, digest: bytes):
+        for resume in resumes:
+            if resume.header.name in prompt:
+                return resume
+        return resumes[digest[0] % len(resumes)]
+
+    def answer(task_name: str, prompt: str, digest: bytes) -> str:
+        if task_name == "jd_task":
+            lines = [l.strip("- ") for l in prompt.splitlines() if l.startswith("- ")]
+            technologies = list(dict.fromkeys(_TECH_RE.findall(" ".join(lines))))
+            return json.dumps(
+                {"technologies": technologies, "responsibilities": lines[:12]}
+            )
+        if task_name == "resume_task":
+            for path in _PDF_PATH_RE.findall(prompt):
+                if os.path.exists(path):
+                    return extract_pdf_text(path)
+            return "\n".join(resume_lines(pick_resume(prompt, digest)))
+        if task_name == "writer_task":
+            return pick_resume(prompt, digest).model_dump_json()
+        if task_name in ("latex_task", "final_alignment_task"):
+            return render_resume(pick_resume(prompt, digest))
+        return "OK"
+
+    def call(
+        self,
+        messages,
+        tools=None,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+    ):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+
+        spread = (digest[1] / 255 - 0.5) * 2 * jitter
+        route = current_route()
+        speed = MODEL_LATENCY.get(route.model if route else self.model, 1.0)
+        time.sleep(max(0.0, latency * speed * (1 + spread)))
+
+        text = STUB_ANSWER.format(
+            answer(getattr(from_task, "name", ""), prompt, digest)
+        )
+        usage = Usage(
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=len(text) // 4,
+            total_tokens=(len(prompt) + len(text)) // 4,
+        )
+        for callback in callbacks or []:
+            if hasattr(callback, "log_success_event"):
+                callback.log_success_event(
+                    kwargs={}, response_obj={"usage": usage}, start_time=0, end_time=0
+                )
+        return text
+
+    LLM.call = call
+
+
+def install_local_store(store_dir: str) -> None:
+    """
+    Content-addressed local directory in place of Supabase and Cloudinary.
+    """
+    import supabase_upload
+    from resume_tailor.instrumentation import timed
+
+    def store(file_path: str, folder: str, r=None) -> str:
+        ext = os.path.splitext(file_path)[1]
+        target = os.path.join(
+            store_dir, folder, supabase_upload.file_digest(file_path) + ext
+        )
+        with timed("upload", "local"):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(file_path, target)
+        return "file://" + target
+
+    supabase_upload.upload_tex_to_supabase = store
+    supabase_upload.upload_pdf_to_cloudinary = store
+
+
+def install_stub_latex(latency: float) -> None:
+    """
+    Fake pdflatex: a one-page PDF and a log the diagnostics parser accepts.
+    """
+    import latex_compile
+    from resume_tailor.instrumentation import timed
+
+    def run_pdflatex(workdir, base, source, fmt):
+        with timed("pdflatex", "stub"):
+            time.sleep(latency)
+            pdf = text_pdf([base])
+            with open(os.path.join(workdir, base + ".pdf"), "wb") as f:
+                f.write(pdf)
+        log = f"Output written on {base}.pdf (1 page, {len(pdf)} bytes).\n"
+        return 0, log
+
+    latex_compile._run_pdflatex = run_pdflatex
+
+
+# ---------------- workers ----------------
+
+
+class _Enqueue:
+    """
+    Stands in for FairQueue's hand-off to Celery: dispatched jobs go to the
+    worker processes instead of a broker.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, task_name, args, kwargs, queue):
+        self.queue.put((args, kwargs))
+
+
+def worker_loop(jobs, stats, latex_stub: bool) -> None:
+    import celery_worker
+
+    if latex_stub:
+        celery_worker.precompile_format = lambda preamble: None
+    celery_worker.init_clients = lambda: None
+    celery_worker.init_worker_process()
+    stats.put({"ready": os.getpid()})
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        args, kwargs = job
+        # apply() runs the task in this process with a real task request,
+        # retries included
+        celery_worker.run_crew_task.apply(args=args, kwargs=kwargs)
+
+    # ru_maxrss is in KiB on Linux
+    stats.put(
+        {
+            "pid": os.getpid(),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+# ---------------- report ----------------
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Nearest-rank percentile.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples) -> dict:
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 4),
+        "p95": round(percentile(samples, 95), 4),
+        "p99": round(percentile(samples, 99), 4),
+    }
+
+
+def build_report(
+    args, records, submitted, finished, started, ended, worker_stats, users=None
+):
+    statuses = {}
+    stages = {}
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0, "saved_tokens": 0}
+    routes = {}
+    cost = 0.0
+    for job_id, data in records.items():
+        statuses[data["status"]] = statuses.get(data["status"], 0) + 1
+        for span in (data.get("metrics") or {}).get("spans", []):
+            key = f"{span['kind']}:{span['name']}"
+            stages.setdefault(key, []).append(span["seconds"])
+            # task spans repeat their LLM calls' tokens; count the calls only
+            fields = tokens if span["kind"] == "llm" else ("saved_tokens",)
+            for field in fields:
+                tokens[field] += span.get(field) or 0
+            if span["kind"] == "llm":
+                cost += span.get("cost_usd") or 0
+                if "rule" in span:
+                    route = f"{span['task']}:{span['model']}:{span['rule']}"
+                    routes[route] = routes.get(route, 0) + 1
+
+    elapsed = ended - started
+    end_to_end = [finished[j] - submitted[j] for j in finished]
+    completed = statuses.get("completed", 0)
+    by_user = {}
+    if args.heavy_share:
+        for job_id in finished:
+            group = "heavy" if users[job_id] == HEAVY_USER else "others"
+            by_user.setdefault(group, []).append(finished[job_id] - submitted[job_id])
+    return {
+        "config": {
+            k: v for k, v in vars(args).items() if k not in ("corpus", "json_path")
+        },
+        "jobs": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "jobs_per_s": round(completed / elapsed, 3) if elapsed else 0.0,
+        "end_to_end_s": summarize(end_to_end),
+        "end_to_end_by_user_s": {k: summarize(v) for k, v in by_user.items()},
+        "stages_s": {k: summarize(v) for k, v in sorted(stages.items())},
+        "tokens": tokens,
+        "llm_cost_usd": round(cost, 4),
+        "routes": dict(sorted(routes.items())),
+        "workers": worker_stats,
+    }
+
+
+def print_report(report) -> None:
+    print(f"jobs:            {report['jobs']}")
+    print(f"elapsed:         {report['elapsed_s']:.2f} s")
+    print(f"throughput:      {report['jobs_per_s']:.3f} jobs/s")
+    e2e = report["end_to_end_s"]
+    print(
+        f"end to end:      p50 {e2e['p50']:.3f}  p95 {e2e['p95']:.3f}  "
+        f"p99 {e2e['p99']:.3f} s"
+    )
+    for group, s in sorted(report["end_to_end_by_user_s"].items()):
+        print(
+            f"  {group + ':':15}p50 {s['p50']:.3f}  p95 {s['p95']:.3f}  "
+            f"p99 {s['p99']:.3f} s  ({s['count']} jobs)"
+        )
+    print(f"tokens:          {report['tokens']}")
+    print(f"llm cost:        ${report['llm_cost_usd']:.4f}")
+    for route, calls in report["routes"].items():
+        print(f"  {route:50} {calls:6d} calls")
+    print()
+    print(f"{'stage':40} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, s in report["stages_s"].items():
+        print(
+            f"{name[:40]:40} {s['count']:6d} {s['p50']:9.3f} {s['p95']:9.3f} "
+            f"{s['p99']:9.3f}"
+        )
+    print()
+    for w in report["workers"]:
+        print(f"worker {w['pid']}: max RSS {w['max_rss_mb']:.1f} MB")
+
+
+# ---------------- main ----------------
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scratch = tempfile.mkdtemp(prefix="resume_tailor_bench_")
+    server = None
+    if args.redis_url:
+        redis_url = args.redis_url
+    else:
+        server, redis_url = start_fake_redis()
+    prepare_env(redis_url, scratch, args.llm_limits, args.routing)
+
+    latex_stub = args.latex == "stub" or (
+        args.latex == "auto" and shutil.which("pdflatex") is None
+    )
+
+    import app as api
+    import celery_worker
+    import fair_queue
+
+    resumes, pdf_paths, jds = load_corpus(args.corpus, scratch)
+    install_stub_llm(resumes, args.llm_latency, args.llm_jitter)
+    install_local_store(os.path.join(scratch, "artifacts"))
+    if latex_stub:
+        install_stub_latex(args.latex_latency)
+    if args.cold:
+        celery_worker.stage_cache = None
+
+    # fork after the stand-ins are installed so every worker inherits them
+    ctx = multiprocessing.get_context("fork")
+    jobs, stats = ctx.Queue(), ctx.Queue()
+    celery_worker.fair_queue.send = _Enqueue(jobs)
+    fair_queue.TIER_SLOTS[fair_queue.INTERACTIVE] = args.workers
+    workers = [
+        ctx.Process(target=worker_loop, args=(jobs, stats, latex_stub), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for w in workers:
+        w.start()
+    # time the jobs, not the workers' warm-up
+    for _ in workers:
+        stats.get(timeout=args.timeout)
+
+    client = api.app.test_client()
+    submitted, users = {}, {}
+    heavy_jobs = round(args.jobs * args.heavy_share)
+    started = time.perf_counter()
+
+    def submit(i: int):
+        if args.rate:
+            time.sleep(max(0.0, started + i / args.rate - time.perf_counter()))
+        # a unique reference keeps single-flight from merging replayed jobs
+        text = f"{jds[i % len(jds)]}\n\nRef: bench-{uuid.uuid4().hex[:8]}"
+        if i < heavy_jobs:
+            user = HEAVY_USER
+        else:
+            user = f"bench-{i % max(1, args.users - (1 if heavy_jobs else 0))}"
+        body = {"pdf_url": pdf_paths[i % len(pdf_paths)], "text": text}
+        headers = {"X-Proxy-Secret": PROXY_SECRET, "X-User-Id": user}
+        sent = time.perf_counter()
+        job_id = client.post("/start-job", json=body, headers=headers).get_json()[
+            "job_id"
+        ]
+        submitted[job_id], users[job_id] = sent, user
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(submit, range(args.jobs)))
+
+    finished, records = {}, {}
+    deadline = started + args.timeout
+    while len(finished) < len(submitted) and time.perf_counter() < deadline:
+        pending = [j for j in submitted if j not in finished]
+        for job_id, raw in zip(pending, api.r.mget([f"job:{j}" for j in pending])):
+            data = json.loads(raw) if raw else None
+            if data and data["status"] in TERMINAL:
+                finished[job_id] = time.perf_counter()
+                records[job_id] = data
+        time.sleep(0.05)
+    ended = max(finished.values(), default=time.perf_counter())
+
+    for _ in workers:
+        jobs.put(None)
+    worker_stats = [stats.get(timeout=30) for _ in workers]
+    for w in workers:
+        w.join(timeout=10)
+
+    report = build_report(
+        args, records, submitted, finished, started, ended, worker_stats, users
+    )
+    if len(finished) < len(submitted):
+        report["timed_out"] = len(submitted) - len(finished)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if server is not None:
+        server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
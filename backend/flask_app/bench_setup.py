@@ -0,0 +1,53 @@
+# flask_app/bench_setup.py
+"""
+Startup and per-job setup benchmark for the warm crew template.
+
+Compares what every job used to pay (a cold ResumeTailor().crew(), which
+re-parses the YAML and rebuilds agents, LLMs and tools) against a copy of
+the per-process template. No LLM calls are made.
+
+    python bench_setup.py [iterations]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+
+def _median_ms(fn, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    start = time.perf_counter()
+    import crew_wrapper
+
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    crew_wrapper.warm_up()
+    warm_up_ms = (time.perf_counter() - start) * 1000
+
+    cold_ms = _median_ms(lambda: crew_wrapper.ResumeTailor().crew(), iterations)
+    copy_ms = _median_ms(crew_wrapper.new_crew, iterations)
+
+    print(f"import crew_wrapper:        {import_ms:8.1f} ms (once per process)")
+    print(f"warm_up (template build):   {warm_up_ms:8.1f} ms (once per process)")
+    print(f"per job, cold crew():       {cold_ms:8.1f} ms (median of {iterations})")
+    print(f"per job, template copy():   {copy_ms:8.1f} ms (median of {iterations})")
+    if copy_ms > 0:
+        print(f"speedup:                    {cold_ms / copy_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,529 @@
 # flask_app/celery_worker.py
-import os
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from celery import Celery
+from celery.signals import worker_process_init, worker_ready
 import redis
 from dotenv import load_dotenv
-from latex_compile import compile_latex
-from supabase_upload import upload_pdf_to_cloudinary
-from supabase_upload import upload_tex_to_supabase
-
+from latex_compile import LatexCompileError, compile_latex, precompile_format
+from latex_repair import repair_latex, strip_code_fences
+from supabase_upload import tex_object_path, upload_artifacts, upload_artifact_group
+from supabase_upload import init_clients
+from workspace import job_workspace
+from one_page_fit import fit_one_page
+from stage_cache import StageCache
+from single_flight import job_fingerprint, release
+from job_events import publish_status
+from status_api import encode
+from checkpoints import JobCheckpoints, JobStageRecord
+from fair_queue import BULK, INTERACTIVE, FairQueue
+from metrics import observe
+from jd_boilerplate import BoilerplateIndex
+from result_cache import ResultCache
 
 load_dotenv()
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 BROKER_URL = os.environ.get("BROKER_URL", REDIS_URL)
 BACKEND_URL = os.environ.get("BACKEND_URL", REDIS_URL)
+# compile-and-measure fitting instead of trusting the LLM to hit one page
+ONE_PAGE_FIT = os.environ.get("ONE_PAGE_FIT", "1") == "1"
+# failed jobs are retried and resume from their last checkpointed stage
+JOB_MAX_RETRIES = int(os.environ.get("JOB_MAX_RETRIES", 2))
+JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY", 10))
+# batch items tailored at the same time inside one batch task
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", 4))
 
 celery_app = Celery(
     "crew_tasks",
     broker=BROKER_URL,
     backend=BACKEND_URL,
 )
+# separate workers per queue: celery -A celery_worker worker -Q interactive
+# (and -Q bulk), each with the concurrency FairQueue's TIER_SLOTS assumes
+celery_app.conf.task_routes = {
+    "run_crew_task": {"queue": INTERACTIVE},
+    "run_batch_task": {"queue": BULK},
+}
+# FairQueue decides the order; a worker must not hoard jobs it can't start
+celery_app.conf.worker_prefetch_multiplier = 1
 
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+stage_cache = StageCache(r)
+jd_boilerplate = BoilerplateIndex(r)
+# one-page fitting changes the PDF, so it is part of the result key
+result_cache = ResultCache(r, variant=f"one_page_fit={ONE_PAGE_FIT}")
+
+
+def send_job(task_name, args, kwargs, queue):
+    celery_app.send_task(task_name, args=args, kwargs=kwargs, queue=queue)
+
+
+def fail_unsent(job_id, error):
+    """
+    A job the fair queue could not hand to Celery: it fails, and so do the
+    items of a batch.
+    """
+    raw = r.get(f"job:{job_id}")
+    items = (json.loads(raw).get("payload") or {}).get("items", []) if raw else []
+    payload = {"error": f"could not be queued: {error}"}
+    for item in items:
+        set_status(item, "failed", payload)
+    set_status(job_id, "failed", payload)
 
 
-def set_status(job_id, status, payload=None):
+fair_queue = FairQueue(r, send_job, on_unsent=fail_unsent)
+
+
+def set_status(job_id, status, payload=None, stage=None, metrics=None, progress=None):
     key = f"job:{job_id}"
     data = {"status": status}
+    if stage is not None:
+        data["stage"] = stage
+    if progress is not None:
+        # partial output of a streaming stage: chars, section, complete
+        data["progress"] = progress
     if payload is not None:
         data["payload"] = payload
-    r.set(key, json.dumps(data), ex=60 * 60 * 24)
+    if metrics is not None:
+        data["metrics"] = metrics
+    r.set(key, encode(data), ex=60 * 60 * 24)
+    publish_status(r, job_id, data)
+    if status == "running":
+        fair_queue.touch(job_id)
+
 
+from crew_wrapper import (
+    TEX_FILE_NAME,
+    extract_resume,
+    fetch_resume,
+    run_agent,
+    warm_up,
+)
+from resume_tailor.latex_renderer import PREAMBLE
+from resume_tailor.instrumentation import recording
+from resume_tailor.scheduling import BATCH, priority, set_scheduler
+from llm_scheduler import RedisLLMScheduler
 
-from crew_wrapper import run_agent
 
+def job_metrics(recorder, started, status):
+    """
+    Closes out the attempt's spans, folds them into the shared histograms
+    and returns the summary stored on the job record.
+    """
+    recorder.add("job", "attempt", time.perf_counter() - started)
+    summary = recorder.summary()
+    observe(r, summary["spans"], status)
+    return summary
 
-@celery_app.task(bind=True, name="run_crew_task", soft_time_limit=3600)
-def run_crew_task(self, job_id: str, pdf_url: str, text: str):
-    try:
-        set_status(job_id, "running")
 
-        result = run_agent(pdf_url, text)
+@worker_ready.connect
+def start_fair_queue_dispatcher(**kwargs):
+    # in the main process: fills slots freed by expired leases even when
+    # nothing is submitted or finishing
+    fair_queue.start_dispatcher()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # build the crew template and HTTP clients once per child process,
+    # so jobs only pay for a cheap copy
+    warm_up()
+    init_clients()
+    precompile_format(PREAMBLE)
+    # every LLM call in this process waits on the shared rate limits
+    set_scheduler(RedisLLMScheduler(r))
+
+
+def build_pdf(
+    pdf_url,
+    text,
+    workdir,
+    checkpoints,
+    on_stage,
+    shared_stages=None,
+    stage_record=None,
+    previous_stages=None,
+    user=None,
+):
+    """
+    Crew → .tex → PDF for one job, checkpointing after each step and
+    skipping the steps an earlier attempt already finished.
+    `on_stage(stage, progress=None)` also receives the streaming LaTeX
+    stages' progress. The crew's stage record goes to `stage_record`;
+    `previous_stages` re-tailors an earlier job and `user` is whom the JD
+    came from (see run_agent).
+    Returns the .tex path and the compile/fit result.
+    """
+    done = checkpoints.load()
+    tex_path = os.path.join(workdir, TEX_FILE_NAME)
+
+    if "tex" in done:
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(done["tex"])
+    else:
+        result = run_agent(
+            pdf_url,
+            text,
+            workdir,
+            cache=stage_cache,
+            on_stage=on_stage,
+            checkpoints=checkpoints,
+            shared_stages=shared_stages,
+            boilerplate=jd_boilerplate,
+            on_progress=on_stage,
+            previous_stages=previous_stages,
+            user=user,
+        )
 
         # Check for errors from run_agent
         if "error" in result:
             raise Exception(f"Agent error: {result['error']}")
 
+        if stage_record is not None:
+            stage_record.save(result["stage_record"])
+        checkpoints.save(
+            "stages",
+            {
+                "reused_stages": result["reused_stages"],
+                "rerun_stages": result["rerun_stages"],
+                "routing": result["routing"],
+            },
+        )
         tex_path = result["tex_file_path"]
+        with open(tex_path, encoding="utf-8") as f:
+            checkpoints.save("tex", f.read())
+
+    compiled = done.get("compile")
+    if compiled is None or not os.path.exists(compiled["pdf_path"]):
+        compiled = compile_tex(tex_path, checkpoints)
+        checkpoints.save("compile", compiled)
+    on_stage("compile")
+    return tex_path, compiled
+
+
+def _compile(tex_path):
+    if ONE_PAGE_FIT:
+        return fit_one_page(tex_path)
+    return {"pdf_path": compile_latex(tex_path)}
+
+
+def compile_tex(tex_path, checkpoints):
+    """
+    Compiles (and fits) the .tex. When pdflatex rejects it, the document is
+    repaired by latex_repair and compiled again instead of failing the job;
+    the repaired source replaces the "tex" checkpoint.
+    """
+    with open(tex_path, encoding="utf-8") as f:
+        source = f.read()
+    cleaned = strip_code_fences(source)
+    if cleaned != source:
+        source = cleaned
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(source)
+
+    try:
+        return _compile(tex_path)
+    except LatexCompileError:
+        # fitting rewrote the file; repair the document as the crew left it
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        repair = repair_latex(tex_path)
+        with open(tex_path, encoding="utf-8") as f:
+            checkpoints.save("tex", f.read())
+        compiled = _compile(tex_path)
+        compiled["repair"] = repair
+        return compiled
+
+
+def job_payload(urls, compiled):
+    payload = dict(urls)
+    if ONE_PAGE_FIT:
+        payload["layout_fit"] = {
+            k: v for k, v in compiled.items() if k not in ("pdf_path", "repair")
+        }
+    if "repair" in compiled:
+        payload["latex_repair"] = compiled["repair"]
+    return payload
+
+
+def retailor_report(previous_job, checkpoints) -> dict:
+    stages = checkpoints.load().get("stages", {})
+    return {
+        "previous_job_id": previous_job,
+        "reused_stages": stages.get("reused_stages", []),
+        "rerun_stages": stages.get("rerun_stages", []),
+    }
+
+
+def routing_of(checkpoints):
+    """
+    The models the job's stages were routed to (see run_agent); None when
+    the crew did not run.
+    """
+    return checkpoints.load().get("stages", {}).get("routing")
+
+
+def run_pipeline(
+    pdf_url,
+    text,
+    workdir,
+    checkpoints,
+    on_stage,
+    bypass_cache=False,
+    stage_record=None,
+    previous_job=None,
+    user=None,
+):
+    """
+    build_pdf followed by the upload, for a single job. A resume and JD
+    seen before (same bytes, same pipeline) are answered from the result
+    cache unless `bypass_cache` is set; the fresh result is stored either way.
+    With `previous_job` the job re-tailors that job's stage record, and the
+    payload's "retailor" entry lists the stages that were reused and rerun.
+    A fresh result's "routing" entry records the model of every stage.
+    """
+    done = checkpoints.load()
+    if "upload" in done:
+        return done["upload"]
+    if stage_record is not None:
+        stage_record.save_request(pdf_url, text)
+
+    resume_path = fetch_resume(pdf_url, workdir)
+    with open(resume_path, "rb") as f:
+        result_key = result_cache.key(f.read(), text)
+    if not bypass_cache:
+        cached = result_cache.get(result_key)
+        if cached is not None:
+            result_cache.remember_url(pdf_url, text, result_key)
+            on_stage("result_cache")
+            if previous_job is not None:
+                cached["retailor"] = retailor_report(previous_job, checkpoints)
+            return cached
+
+    previous_stages = None
+    if previous_job is not None:
+        previous_stages = JobStageRecord(r, previous_job).stages()
+    tex_path, compiled = build_pdf(
+        resume_path,
+        text,
+        workdir,
+        checkpoints,
+        on_stage,
+        stage_record=stage_record,
+        previous_stages=previous_stages,
+        user=user,
+    )
+    payload = job_payload(upload_artifacts(tex_path, compiled["pdf_path"], r), compiled)
+    result_cache.put(result_key, payload, tex_object_path(tex_path))
+    result_cache.remember_url(pdf_url, text, result_key)
+    # not part of the cached result: these describe this run only
+    payload["routing"] = routing_of(checkpoints)
+    if previous_job is not None:
+        payload["retailor"] = retailor_report(previous_job, checkpoints)
+    checkpoints.save("upload", payload)
+    on_stage("upload")
+    return payload
+
+
+@celery_app.task(
+    bind=True,
+    name="run_crew_task",
+    soft_time_limit=3600,
+    max_retries=JOB_MAX_RETRIES,
+    default_retry_delay=JOB_RETRY_DELAY,
+)
+def run_crew_task(
+    self,
+    job_id: str,
+    pdf_url: str,
+    text: str,
+    bypass_cache=False,
+    previous_job=None,
+    user=None,
+):
+    fingerprint = job_fingerprint(pdf_url, text)
+    checkpoints = JobCheckpoints(r, job_id)
+    will_retry = self.request.retries < self.max_retries
+    started = time.perf_counter()
+    with recording() as recorder:
+        try:
+            set_status(job_id, "running")
+
+            def on_stage(stage, progress=None):
+                set_status(job_id, "running", stage=stage, progress=progress)
+
+            # each job gets its own directory so concurrent jobs never share files;
+            # it survives a failed attempt that will be retried
+            with job_workspace(job_id, keep_on_error=will_retry) as workdir:
+                payload = run_pipeline(
+                    pdf_url,
+                    text,
+                    workdir,
+                    checkpoints,
+                    on_stage,
+                    bypass_cache,
+                    stage_record=JobStageRecord(r, job_id),
+                    previous_job=previous_job,
+                    user=user,
+                )
+
+            metrics = job_metrics(recorder, started, "completed")
+            set_status(job_id, "completed", payload, metrics=metrics)
+            release(r, fingerprint, job_id, completed=True)
+            fair_queue.release(job_id)
+            return payload
+
+        except Exception as e:
+            if will_retry:
+                # keep the single-flight claim: the retry is still this job
+                metrics = job_metrics(recorder, started, "retried")
+                retry = self.request.retries + 1
+                set_status(
+                    job_id,
+                    "queued",
+                    {"retry": retry, "error": str(e)},
+                    metrics=metrics,
+                )
+                raise self.retry(exc=e)
+            metrics = job_metrics(recorder, started, "failed")
+            set_status(job_id, "failed", {"error": str(e)}, metrics=metrics)
+            release(r, fingerprint, job_id, completed=False)
+            fair_queue.release(job_id)
+            raise
+
+
+@celery_app.task(bind=True, name="run_batch_task", soft_time_limit=3 * 3600)
+def run_batch_task(
+    self, batch_id: str, pdf_url: str, items: list, bypass_cache=False, user=None
+):
+    """
+    Tailors one resume to many JDs. `items` is a list of [job_id, text].
+    Items found in the result cache complete without running.
+
+    The resume is downloaded and extracted once; the JD-dependent stages
+    then run for up to BATCH_PARALLELISM items at a time, and the finished
+    PDFs are uploaded together. Every item keeps its own job record, so
+    /job-status and /job-events work per item; the batch record at
+    job:{batch_id} tracks the counts.
+    """
+    job_ids = [job_id for job_id, _ in items]
+    finished = {}
+    started = time.perf_counter()
+
+    def batch_summary():
+        counts = {}
+        for job_id in job_ids:
+            status = finished.get(job_id, "running")
+            counts[status] = counts.get(status, 0) + 1
+        return {"items": job_ids, "counts": counts}
+
+    def finish_item(job_id, status, payload):
+        finished[job_id] = status
+        set_status(job_id, status, payload)
+
+    with recording() as recorder, priority(BATCH):
+        try:
+            set_status(batch_id, "running", batch_summary(), stage="resume_task")
+            with job_workspace(batch_id) as workdir:
+                resume_path = fetch_resume(pdf_url, workdir)
+                with open(resume_path, "rb") as f:
+                    pdf_bytes = f.read()
+                result_keys = {
+                    job_id: result_cache.key(pdf_bytes, text) for job_id, text in items
+                }
+                if not bypass_cache:
+                    for job_id, text in items:
+                        cached = result_cache.get(result_keys[job_id])
+                        if cached is not None:
+                            result_cache.remember_url(
+                                pdf_url, text, result_keys[job_id]
+                            )
+                            finish_item(job_id, "completed", cached)
+                pending = [item for item in items if item[0] not in finished]
+                shared = (
+                    {"resume_task": extract_resume(resume_path, stage_cache)}
+                    if pending
+                    else {}
+                )
+
+                def build(item):
+                    job_id, text = item
+                    item_dir = os.path.join(workdir, job_id)
+                    os.makedirs(item_dir, exist_ok=True)
+
+                    def on_stage(stage, progress=None):
+                        set_status(job_id, "running", stage=stage, progress=progress)
+                        # item updates keep the batch's slot lease alive
+                        fair_queue.touch(batch_id)
 
-        pdf_path = compile_latex(tex_path)
+                    on_stage("resume_task")
+                    stage_record = JobStageRecord(r, job_id)
+                    stage_record.save_request(pdf_url, text)
+                    try:
+                        return build_pdf(
+                            resume_path,
+                            text,
+                            item_dir,
+                            JobCheckpoints(r, job_id),
+                            on_stage,
+                            shared_stages=shared,
+                            stage_record=stage_record,
+                            user=user,
+                        )
+                    except Exception as e:
+                        finish_item(job_id, "failed", {"error": str(e)})
+                        return None
 
-        tex_url = upload_tex_to_supabase(tex_path, "latex")
-        pdf_url = upload_pdf_to_cloudinary(pdf_path, "pdf")
+                set_status(batch_id, "running", batch_summary(), stage="tailor")
+                with ThreadPoolExecutor(max_workers=BATCH_PARALLELISM) as pool:
+                    built = dict(
+                        zip([job_id for job_id, _ in pending], pool.map(build, pending))
+                    )
 
-        payload = {"tex_url": tex_url, "pdf_url": pdf_url}
+                ready = [(job_id, b) for job_id, b in built.items() if b is not None]
+                set_status(batch_id, "running", batch_summary(), stage="upload")
+                urls = upload_artifact_group(
+                    [
+                        (tex_path, compiled["pdf_path"])
+                        for _, (tex_path, compiled) in ready
+                    ],
+                    r,
+                )
+                texts = dict(items)
+                for (job_id, (tex_path, compiled)), item_urls in zip(ready, urls):
+                    payload = job_payload(item_urls, compiled)
+                    result_cache.put(
+                        result_keys[job_id], payload, tex_object_path(tex_path)
+                    )
+                    result_cache.remember_url(
+                        pdf_url, texts[job_id], result_keys[job_id]
+                    )
+                    payload["routing"] = routing_of(JobCheckpoints(r, job_id))
+                    finish_item(job_id, "completed", payload)
 
-        set_status(job_id, "completed", payload)
-        return payload
+            completed = sum(1 for s in finished.values() if s == "completed")
+            if completed == len(job_ids):
+                status = "completed"
+            else:
+                status = "partial" if completed else "failed"
+            metrics = job_metrics(recorder, started, status)
+            set_status(batch_id, status, batch_summary(), metrics=metrics)
+            return batch_summary()
 
-    except Exception as e:
-        set_status(job_id, "failed", {"error": str(e)})
-        raise
+        except Exception as e:
+            for job_id in job_ids:
+                if job_id not in finished:
+                    finish_item(job_id, "failed", {"error": str(e)})
+            metrics = job_metrics(recorder, started, "failed")
+            set_status(
+                batch_id,
+                "failed",
+                {**batch_summary(), "error": str(e)},
+                metrics=metrics,
+            )
+            raise
+        finally:
+            fair_queue.release(batch_id)
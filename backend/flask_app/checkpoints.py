@@ -0,0 +1,68 @@
+# flask_app/checkpoints.py
+import json
+import os
+
+CHECKPOINT_TTL = 60 * 60 * 24  # same lifetime as the job record
+
+
+class JobCheckpoints:
+    """
+    Per-job stage outputs stored in the Redis hash `job:{id}:checkpoints`.
+
+    Every completed stage (crew tasks, the final .tex, the PDF path, the
+    uploaded URLs) is saved as it finishes, so a retried job resumes after
+    the last completed stage instead of redoing its LLM calls.
+    """
+
+    def __init__(self, r, job_id: str):
+        self.r = r
+        self.key = f"job:{job_id}:checkpoints"
+
+    def load(self) -> dict:
+        return {k: json.loads(v) for k, v in self.r.hgetall(self.key).items()}
+
+    def save(self, stage: str, value) -> None:
+        pipe = self.r.pipeline()
+        pipe.hset(self.key, stage, json.dumps(value))
+        pipe.expire(self.key, CHECKPOINT_TTL)
+        pipe.execute()
+
+
+# how long a finished job can be re-tailored from its stage record
+STAGE_RECORD_TTL = int(os.environ.get("STAGE_RECORD_TTL", 60 * 60 * 24 * 7))
+
+
+class JobStageRecord:
+    """
+    What a job's crew tasks read and wrote, in the Redis hash
+    `job:{id}:stages`: per task the hash of its inputs and its output, plus
+    the job's request under "_request". A re-tailor of the job reruns only
+    the tasks whose inputs hash differently.
+    """
+
+    REQUEST = "_request"
+
+    def __init__(self, r, job_id: str):
+        self.r = r
+        self.key = f"job:{job_id}:stages"
+
+    def load(self) -> dict:
+        return {k: json.loads(v) for k, v in self.r.hgetall(self.key).items()}
+
+    def request(self):
+        raw = self.r.hget(self.key, self.REQUEST)
+        return json.loads(raw) if raw else None
+
+    def stages(self) -> dict:
+        record = self.load()
+        record.pop(self.REQUEST, None)
+        return record
+
+    def save_request(self, pdf_url: str, text: str) -> None:
+        self.save({self.REQUEST: {"pdf_url": pdf_url, "text": text}})
+
+    def save(self, fields: dict) -> None:
+        pipe = self.r.pipeline()
+        pipe.hset(self.key, mapping={k: json.dumps(v) for k, v in fields.items()})
+        pipe.expire(self.key, STAGE_RECORD_TTL)
+        pipe.execute()
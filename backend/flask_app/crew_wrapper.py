@@ -1,7 +1,9 @@
 # flask_app/crew_wrapper.py
 
 import os
+import re
 import sys
+import shutil
 from datetime import datetime
 
 # ensure project src is on sys.path so "resume_tailor" package can be imported
@@ -11,47 +13,342 @@ SRC_PATH = os.path.join(PROJECT_ROOT, "resume_tailor", "src")
 if SRC_PATH not in sys.path:
     sys.path.insert(0, SRC_PATH)
 
-from resume_tailor.crew import ResumeTailor
+from resume_tailor.crew import (
+    LATEX_MODE,
+    LLM_LATEX_STAGES,
+    ResumeTailor,
+    TEX_FILE_NAME,
+    prefill_stages,
+    stage_fingerprint,
+    task_output_text,
+)
+from resume_tailor.downloads import fetch_pdf, is_url
+from resume_tailor.instrumentation import current, record_task, timed
+from resume_tailor.latex_renderer import write_resume_tex
+from resume_tailor.prompt_compaction import preprocess_jd
+from resume_tailor.routing import routing_report
+from resume_tailor.schema import TailoredResume
+from resume_tailor.streaming import watching
+from stage_cache import content_key, normalize_text
 
-TEX_FILE_NAME = "tailored_resume.tex"
+RESUME_FILE_NAME = "resume.pdf"
 
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
 
-def run_agent(pdf_url: str, text: str) -> dict:
+# parsed YAML, agents, LLMs and tools, built once per worker process
+_crew_template = None
+
+
+def warm_up():
     """
-    Runs the CrewAI agent and returns all relevant outputs,
-    including the path to the generated .tex file.
+    Builds the crew template for this process. Never kicked off itself;
+    every job runs on a copy from new_crew().
+    """
+    global _crew_template
+    if _crew_template is None:
+        _crew_template = ResumeTailor().crew()
+    return _crew_template
+
+
+def new_crew():
+    return warm_up().copy()
+
+
+def fetch_resume(pdf_url: str, workdir: str) -> str:
+    """
+    Copies the resume into the job workspace and returns the local path, so
+    it is fetched once per job and can be hashed before the crew runs.
+    URLs go through the download cache: a repeat user's unchanged resume is
+    not downloaded again.
     """
+    local_path = os.path.join(workdir, RESUME_FILE_NAME)
+    source = fetch_pdf(pdf_url) if is_url(pdf_url) else pdf_url
+    if os.path.abspath(source) != os.path.abspath(local_path):
+        shutil.copyfile(source, local_path)
+
+    return local_path
+
 
-    inputs = {
-        "jd_text": text,
-        "resume_url": pdf_url,
-        "current_year": str(datetime.now().year),
+def stage_cache_keys(text: str, pdf_bytes: bytes) -> dict:
+    """
+    Content-addressed cache keys for the stages that only depend on one
+    input: the JD analysis (keyed on the JD as submitted) and the resume
+    extraction.
+    """
+    return {
+        "jd_task": content_key(normalize_text(text), stage_fingerprint("jd_task")),
+        "resume_task": content_key(pdf_bytes, stage_fingerprint("resume_task")),
     }
 
+
+def stage_dependencies(tasks) -> dict:
+    """
+    What each task reads, by name: the kickoff inputs its prompt
+    interpolates and the tasks whose output reaches it as context. Without
+    an explicit context the sequential crew hands a task every earlier
+    output (an async task the last synchronous one), so that is assumed.
+    Call before kickoff, while the prompts are not yet interpolated.
+    """
+    deps, earlier, last_sync = {}, [], None
+    for t in tasks:
+        if isinstance(t.context, list):
+            context = [c.name for c in t.context]
+        elif t.async_execution:
+            context = [last_sync] if last_sync else []
+        else:
+            context = list(earlier)
+        prompt = f"{t.description}{t.expected_output}"
+        deps[t.name] = {
+            "inputs": sorted(set(_PLACEHOLDER_RE.findall(prompt))),
+            "context": context,
+        }
+        earlier.append(t.name)
+        if not t.async_execution:
+            last_sync = t.name
+    return deps
+
+
+def stage_input_keys(deps: dict, inputs: dict, outputs: dict) -> dict:
+    """
+    Hash of everything a task reads (its fingerprint, the inputs it
+    interpolates, its context outputs) for each task in `deps` whose
+    context outputs are all in `outputs`. `inputs` carries the resume's
+    content digest as resume_url, not its path.
+    """
+    keys = {}
+    for name, dep in deps.items():
+        if any(c not in outputs for c in dep["context"]):
+            continue
+        keys[name] = content_key(
+            stage_fingerprint(name),
+            *(f"{k}={inputs.get(k, '')}" for k in dep["inputs"]),
+            *(outputs[c] for c in dep["context"]),
+        )
+    return keys
+
+
+def reusable_stages(deps: dict, inputs: dict, known: dict, previous: dict) -> dict:
+    """
+    Outputs of an earlier job's tasks (`previous`, a JobStageRecord's
+    stages) whose inputs hash the same now. Walks in crew order, so a reused
+    output lets its dependents be compared too.
+    """
+    known, reused = dict(known), {}
+    for name in deps:
+        if name in known or name not in previous:
+            continue
+        key = stage_input_keys({name: deps[name]}, inputs, known).get(name)
+        if key is not None and key == previous[name]["input"]:
+            known[name] = reused[name] = previous[name]["output"]
+    return reused
+
+
+def writer_resume(output) -> TailoredResume:
+    """
+    Structured resume from writer_task's TaskOutput.
+    """
+    if isinstance(output.pydantic, TailoredResume):
+        return output.pydantic
+    return TailoredResume.model_validate_json(output.raw)
+
+
+def extract_resume(resume_path: str, cache=None) -> str:
+    """
+    Runs resume_task on its own and returns its output, so a batch pays for
+    one extraction and hands it to every item through `shared_stages`.
+    """
+    key = None
+    if cache is not None:
+        with open(resume_path, "rb") as f:
+            key = content_key(f.read(), stage_fingerprint("resume_task"))
+        cached = cache.get("resume_task", key)
+        if cached is not None:
+            return cached
+
+    crew = new_crew()
+    crew.tasks = [t for t in crew.tasks if t.name == "resume_task"]
+    task = crew.tasks[0]
+    crew.task_callback = lambda _: record_task(task)
+    crew.kickoff(
+        inputs={
+            "jd_text": "",
+            "resume_url": resume_path,
+            "current_year": str(datetime.now().year),
+            "output_dir": os.path.dirname(os.path.abspath(resume_path)),
+        }
+    )
+
+    extracted = task_output_text(task.output)
+    if key is not None:
+        cache.put("resume_task", key, extracted)
+    return extracted
+
+
+def run_agent(
+    pdf_url: str,
+    text: str,
+    workdir: str,
+    cache=None,
+    on_stage=None,
+    checkpoints=None,
+    shared_stages=None,
+    boilerplate=None,
+    on_progress=None,
+    previous_stages=None,
+    user=None,
+) -> dict:
+    """
+    Runs the CrewAI agent and returns all relevant outputs,
+    including the path to the generated .tex file inside `workdir`.
+
+    When a StageCache is given, cached JD analysis / resume extraction
+    outputs are reused and their LLM stages are skipped.
+    With JobCheckpoints, every finished task is checkpointed and tasks
+    checkpointed by an earlier attempt are not run again.
+    `shared_stages` maps task names to outputs computed once for several
+    jobs (a batch's resume extraction); those tasks are not run either.
+    `on_stage(name)` is called as each task finishes (or is served from cache).
+    The JD is cleaned by preprocess_jd first; a BoilerplateIndex, when
+    given, adds the sentences it learned are boilerplate, and learns from
+    the posting on behalf of the submitting `user`.
+    The LaTeX stages stream their .tex into `workdir`; `on_progress(name,
+    info)` gets their partial progress.
+    `previous_stages` (an earlier job's stage record) re-tailors that job:
+    its task outputs are reused wherever the task's inputs are unchanged.
+    The result's "stage_record" is the record to keep for this job, and
+    its "routing" the model each rerun stage was routed to, with tokens,
+    seconds and estimated cost.
+    """
+
     try:
-        crew = ResumeTailor().crew()
-        result = crew.kickoff(inputs=inputs)
+        resume_path = fetch_resume(pdf_url, workdir)
+
+        # the JD as submitted identifies the posting; its compacted text
+        # depends on what the boilerplate index has learned so far
+        submitted = text
+        jd = preprocess_jd(text, boilerplate.known if boilerplate else None)
+        if boilerplate is not None:
+            posting = content_key(normalize_text(submitted))
+            boilerplate.learn(user, posting, jd.learnable_keys)
+        text = jd.text
+
+        inputs = {
+            "jd_text": text,
+            "resume_url": resume_path,
+            "current_year": str(datetime.now().year),
+            "output_dir": os.path.abspath(workdir),
+        }
+
+        crew = new_crew()
+        tasks = list(crew.tasks)
+        deps = stage_dependencies(tasks)
+        with open(resume_path, "rb") as f:
+            pdf_bytes = f.read()
+        key_inputs = {**inputs, "resume_url": content_key(pdf_bytes)}
+
+        stage_outputs = dict(shared_stages or {})
+        shared = set(stage_outputs)
+        resumed = set()
+        if checkpoints is not None:
+            saved = checkpoints.load()
+            resumed = {t.name for t in tasks if t.name in saved} - shared
+            stage_outputs.update({name: saved[name] for name in resumed})
+
+        # before the stage cache: the earlier job's own outputs keep its
+        # downstream stages comparable
+        reused = {}
+        if previous_stages:
+            reused = reusable_stages(deps, key_inputs, stage_outputs, previous_stages)
+            stage_outputs.update(reused)
+
+        keys = {}
+        if cache is not None:
+            keys = stage_cache_keys(submitted, pdf_bytes)
+            for stage, key in keys.items():
+                if stage in stage_outputs:
+                    continue
+                cached = cache.get(stage, key)
+                if cached is not None:
+                    stage_outputs[stage] = cached
+
+        prefill_stages(crew, stage_outputs)
+        rerun = [t.name for t in crew.tasks]
+        if on_stage is not None:
+            for stage in stage_outputs:
+                on_stage(stage)
+
+        by_name = {t.name: t for t in tasks}
+
+        def task_done(task_output):
+            record_task(by_name[task_output.name])
+            if checkpoints is not None:
+                checkpoints.save(task_output.name, task_output_text(task_output))
+            if on_stage is not None:
+                on_stage(task_output.name)
+
+        crew.task_callback = task_done
+        tex_path = os.path.join(inputs["output_dir"], TEX_FILE_NAME)
+        if crew.tasks:
+            with watching(LLM_LATEX_STAGES, tex_path, on_progress):
+                crew.kickoff(inputs=inputs)
+
+        final = tasks[-1].output
+        if LATEX_MODE == "template":
+            # no LaTeX LLM stages: render the writer's sections locally
+            with timed("render", "latex_renderer"):
+                write_resume_tex(writer_resume(final), tex_path)
+            if on_stage is not None:
+                on_stage("render")
+        elif not os.path.exists(tex_path):
+            # the LaTeX stage was resumed from a checkpoint, not re-run
+            with open(tex_path, "w", encoding="utf-8") as f:
+                f.write(final.raw)
 
         # Check if .tex file exists
-        tex_path = os.path.abspath(TEX_FILE_NAME)
         if not os.path.exists(tex_path):
             raise FileNotFoundError(f"{TEX_FILE_NAME} not found after crew run")
 
-        # Convert result object to dict
-        output = {}
-
-        if hasattr(result, "output"):
-            output["final_output"] = result.output
-
-        if hasattr(result, "tasks_output"):
-            output["tasks"] = [
+        # Convert task outputs to dict
+        output = {
+            "final_output": final.raw,
+            "tasks": [
                 {
-                    "task_id": getattr(t, "id", None),
-                    "task_name": getattr(t, "name", None),
-                    "output": getattr(t, "output", None),
+                    "task_id": str(t.id),
+                    "task_name": t.name,
+                    "output": t.output.raw,
                 }
-                for t in result.tasks_output
-            ]
+                for t in tasks
+            ],
+        }
+
+        outputs = {t.name: task_output_text(t.output) for t in tasks}
+        for t in tasks:
+            if t.name in keys and t.name not in stage_outputs:
+                cache.put(t.name, keys[t.name], outputs[t.name])
+        output["stage_record"] = {
+            name: {"input": key, "output": outputs[name]}
+            for name, key in stage_input_keys(deps, key_inputs, outputs).items()
+        }
+
+        output["cached_stages"] = sorted(
+            set(stage_outputs) - resumed - shared - set(reused)
+        )
+        output["resumed_stages"] = sorted(resumed)
+        output["shared_stages"] = sorted(shared)
+        output["reused_stages"] = sorted(reused)
+        output["rerun_stages"] = rerun
+        recorder = current()
+        output["routing"] = routing_report(
+            recorder.summary()["spans"] if recorder else [],
+            {str(t.id) for t in tasks},
+        )
+        output["jd_preprocessing"] = {
+            "original_chars": jd.original_chars,
+            "chars": len(jd.text),
+            "dropped_boilerplate": jd.dropped_boilerplate,
+            "dropped_duplicates": jd.dropped_duplicates,
+            "truncated": jd.truncated,
+        }
 
         # Include tex file path
         output["tex_file_path"] = tex_path
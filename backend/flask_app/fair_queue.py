@@ -0,0 +1,458 @@
+# flask_app/fair_queue.py
+import json
+import os
+import threading
+import time
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# jobs handed to Celery at once per tier (the Celery queue of the same
+# name); match the concurrency of the workers consuming that queue
+TIER_SLOTS = {
+    INTERACTIVE: int(os.environ.get("FAIRQ_INTERACTIVE_SLOTS", 4)),
+    BULK: int(os.environ.get("FAIRQ_BULK_SLOTS", 2)),
+}
+# jobs one user may have dispatched at once, over both tiers
+USER_MAX_INFLIGHT = int(os.environ.get("FAIRQ_USER_MAX_INFLIGHT", 2))
+# a dispatched job's slot is reclaimed if it reports nothing for this long
+# (a worker that died mid-job); every status update renews it
+LEASE_SECONDS = int(os.environ.get("FAIRQ_LEASE_SECONDS", 1800))
+# every worker re-runs dispatch this often, so slots freed by expired
+# leases (a worker killed mid-job) are filled without waiting for a submit
+DISPATCH_INTERVAL = float(os.environ.get("FAIRQ_DISPATCH_INTERVAL", 5))
+# times a job is put back after Celery refused it before it is failed
+SEND_ATTEMPTS = int(os.environ.get("FAIRQ_SEND_ATTEMPTS", 3))
+# ETA estimate until a tier has finished jobs to average
+DEFAULT_JOB_SECONDS = 120
+JOB_SPEC_TTL = 60 * 60 * 24
+
+# All keys share the {fairq} hash tag, so every script's keys sit in one
+# Redis Cluster slot.
+PREFIX = "{fairq}"
+# job id -> JSON {tier, user, cost, capped, dispatched, failures} while
+# queued or running
+JOBS_KEY = f"{PREFIX}:jobs"
+# job id -> lease expiry of every dispatched job, both tiers
+RUNNING_KEY = f"{PREFIX}:running"
+# user -> fair-share weight, default 1
+WEIGHTS_KEY = f"{PREFIX}:weights"
+
+# Start-time fair queuing per tier: every user with waiting jobs sits in
+# the tier's users zset scored by the virtual start time of their next
+# job. Serving a job advances the user by cost / weight; a user coming
+# back from idle starts at the tier's virtual clock, so idling earns no
+# credit.
+
+
+def tier_keys(tier: str) -> list:
+    """
+    The KEYS of every script but TOUCH_SCRIPT, for `tier`.
+    """
+    return [
+        JOBS_KEY,
+        RUNNING_KEY,
+        WEIGHTS_KEY,
+        # user -> JSON array of their waiting job ids
+        f"{PREFIX}:{tier}:pending",
+        f"{PREFIX}:{tier}:users",
+        f"{PREFIX}:{tier}:vclock",
+        # user -> virtual finish time of their last dispatched job
+        f"{PREFIX}:{tier}:finish",
+        f"{PREFIX}:{tier}:avg_seconds",
+    ]
+
+
+# names tier_keys' KEYS and reads/writes a user's waiting jobs
+_PRELUDE = """
+local jobs, running, weights = KEYS[1], KEYS[2], KEYS[3]
+local pending, users, vclock, finish = KEYS[4], KEYS[5], KEYS[6], KEYS[7]
+local avg_seconds = KEYS[8]
+
+local function waiting(user)
+  local raw = redis.call('HGET', pending, user)
+  return raw and cjson.decode(raw) or {}
+end
+
+local function set_waiting(user, list)
+  if #list > 0 then
+    redis.call('HSET', pending, user, cjson.encode(list))
+  else
+    redis.call('HDEL', pending, user)
+  end
+end
+
+local function now()
+  local t = redis.call('TIME')
+  return tonumber(t[1]) + tonumber(t[2]) / 1000000
+end
+"""
+
+# KEYS: tier_keys(tier)
+# ARGV: tier, user, job id, cost, capped (1/0)
+# Returns the number of jobs the user has waiting in the tier.
+ENQUEUE_SCRIPT = _PRELUDE + """
+local tier, user, job = ARGV[1], ARGV[2], ARGV[3]
+local entry = {
+  tier = tier, user = user, cost = tonumber(ARGV[4]), capped = ARGV[5] == '1'
+}
+redis.call('HSET', jobs, job, cjson.encode(entry))
+local list = waiting(user)
+table.insert(list, job)
+set_waiting(user, list)
+if not redis.call('ZSCORE', users, user) then
+  local clock = tonumber(redis.call('GET', vclock)) or 0
+  local last = tonumber(redis.call('HGET', finish, user)) or 0
+  redis.call('ZADD', users, math.max(clock, last), user)
+end
+return #list
+"""
+
+# KEYS: tier_keys(tier)
+# ARGV: tier, slots, per-user cap, lease seconds
+# Returns the ids of the jobs to hand to Celery now.
+DISPATCH_SCRIPT = _PRELUDE + """
+local tier = ARGV[1]
+local slots, cap, lease = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local started = now()
+-- an expired lease is a worker that died mid-job: the job is dropped
+for _, job in ipairs(redis.call('ZRANGEBYSCORE', running, '-inf', started)) do
+  redis.call('HDEL', jobs, job)
+end
+redis.call('ZREMRANGEBYSCORE', running, '-inf', started)
+
+-- jobs running in this tier, and per user over both tiers
+local busy, inflight = 0, {}
+for _, job in ipairs(redis.call('ZRANGE', running, 0, -1)) do
+  local raw = redis.call('HGET', jobs, job)
+  if raw then
+    local entry = cjson.decode(raw)
+    if entry.tier == tier then
+      busy = busy + 1
+    end
+    inflight[entry.user] = (inflight[entry.user] or 0) + 1
+  end
+end
+
+-- a user at the cap waits, unless their next job is exempt from it
+local function held(user)
+  if (inflight[user] or 0) < cap then
+    return false
+  end
+  local head = waiting(user)[1]
+  local raw = head and redis.call('HGET', jobs, head)
+  return not raw or cjson.decode(raw).capped ~= false
+end
+
+local picked = {}
+while busy < slots do
+  local queued = redis.call('ZRANGE', users, 0, -1, 'WITHSCORES')
+  local user, start
+  for i = 1, #queued, 2 do
+    if not held(queued[i]) then
+      user, start = queued[i], tonumber(queued[i + 1])
+      break
+    end
+  end
+  if not user then
+    break
+  end
+
+  local list = waiting(user)
+  local job = table.remove(list, 1)
+  set_waiting(user, list)
+  local raw = job and redis.call('HGET', jobs, job)
+  local score = start
+  if raw then
+    local entry = cjson.decode(raw)
+    local weight = tonumber(redis.call('HGET', weights, user)) or 1
+    score = start + (entry.cost or 1) / weight
+    redis.call('SET', vclock, start)
+    redis.call('HSET', finish, user, score)
+    entry.dispatched = started
+    redis.call('HSET', jobs, job, cjson.encode(entry))
+    redis.call('ZADD', running, started + lease, job)
+    busy = busy + 1
+    inflight[user] = (inflight[user] or 0) + 1
+    table.insert(picked, job)
+  end
+  if #list > 0 then
+    redis.call('ZADD', users, score, user)
+  else
+    redis.call('ZREM', users, user)
+  end
+end
+return picked
+"""
+
+# KEYS: running
+# ARGV: job id, lease seconds
+TOUCH_SCRIPT = """
+local t = redis.call('TIME')
+local expires = tonumber(t[1]) + tonumber(ARGV[2])
+return redis.call('ZADD', KEYS[1], 'XX', 'CH', expires, ARGV[1])
+"""
+
+# KEYS: tier_keys(tier)
+# ARGV: job id, max send attempts
+# Puts a dispatched job that could not be sent back at the head of its
+# user's line and frees its slots. Returns 0 once it failed too often
+# (dropped from the queue, its spec left to the caller), 1 when requeued.
+REQUEUE_SCRIPT = _PRELUDE + """
+local job = ARGV[1]
+local raw = redis.call('HGET', jobs, job)
+if not raw then
+  return 0
+end
+local entry = cjson.decode(raw)
+redis.call('ZREM', running, job)
+entry.dispatched = nil
+entry.failures = (entry.failures or 0) + 1
+if entry.failures >= tonumber(ARGV[2]) then
+  redis.call('HDEL', jobs, job)
+  return 0
+end
+redis.call('HSET', jobs, job, cjson.encode(entry))
+local list = waiting(entry.user)
+table.insert(list, 1, job)
+set_waiting(entry.user, list)
+local clock = tonumber(redis.call('GET', vclock)) or 0
+local score = tonumber(redis.call('ZSCORE', users, entry.user))
+if not score or score > clock then
+  redis.call('ZADD', users, clock, entry.user)
+end
+return 1
+"""
+
+# KEYS: tier_keys(tier)
+# ARGV: job id
+# Frees the job's slots and folds its run time into the tier's average.
+# Returns the tier, or nil for jobs that never went through the queue.
+RELEASE_SCRIPT = _PRELUDE + """
+local job = ARGV[1]
+local raw = redis.call('HGET', jobs, job)
+if not raw then
+  return nil
+end
+local entry = cjson.decode(raw)
+redis.call('ZREM', running, job)
+local list = waiting(entry.user)
+for i = #list, 1, -1 do
+  if list[i] == job then
+    table.remove(list, i)
+  end
+end
+set_waiting(entry.user, list)
+if entry.dispatched then
+  local seconds = now() - entry.dispatched
+  local avg = tonumber(redis.call('GET', avg_seconds))
+  avg = avg and (0.8 * avg + 0.2 * seconds) or seconds
+  redis.call('SET', avg_seconds, avg)
+end
+redis.call('HDEL', jobs, job)
+return entry.tier
+"""
+
+# KEYS: tier_keys(tier)
+# ARGV: job id
+# Returns {tier, jobs ahead, average job seconds} for a job still waiting,
+# {tier, 0, avg} once dispatched, nil if the job is not queued here. Other
+# users' jobs are assumed to cost 1 each.
+POSITION_SCRIPT = _PRELUDE + """
+local job = ARGV[1]
+local raw = redis.call('HGET', jobs, job)
+if not raw then
+  return nil
+end
+local entry = cjson.decode(raw)
+local user = entry.user
+local avg = redis.call('GET', avg_seconds) or ''
+if entry.dispatched then
+  return {entry.tier, 0, avg}
+end
+
+local index
+for i, id in ipairs(waiting(user)) do
+  if id == job then
+    index = i - 1
+    break
+  end
+end
+if not index then
+  return nil
+end
+
+local function weight(u)
+  return tonumber(redis.call('HGET', weights, u)) or 1
+end
+local start = tonumber(redis.call('ZSCORE', users, user)) or 0
+local tag = start + index / weight(user)
+local ahead = index
+local queued = redis.call('ZRANGE', users, 0, -1, 'WITHSCORES')
+for i = 1, #queued, 2 do
+  if queued[i] ~= user then
+    local before = math.ceil((tag - tonumber(queued[i + 1])) * weight(queued[i]))
+    if before > 0 then
+      ahead = ahead + math.min(before, #waiting(queued[i]))
+    end
+  end
+end
+return {entry.tier, ahead, avg}
+"""
+
+
+def spec_key(job_id: str) -> str:
+    # the Celery call a queued job makes: task, args, kwargs
+    return f"{PREFIX}:job:{job_id}"
+
+
+def queue_entry(result):
+    """
+    The "queue" entry of a job status record from POSITION_SCRIPT's
+    result: tier, jobs ahead and a rough ETA until the job finishes.
+    """
+    if not result:
+        return None
+    tier, ahead, avg = result
+    avg = float(avg) if avg else DEFAULT_JOB_SECONDS
+    slots = max(1, TIER_SLOTS.get(tier, 1))
+    return {
+        "tier": tier,
+        "position": int(ahead),
+        "eta_seconds": round(avg * (1 + int(ahead) / slots)),
+    }
+
+
+class FairQueue:
+    """
+    Holds jobs in Redis and hands them to Celery only while their tier has
+    a free slot and their user is under USER_MAX_INFLIGHT (jobs submitted
+    uncapped skip that check), picking the next job by weighted fair
+    queuing across users (weights in the hash WEIGHTS_KEY, default 1). Celery's queues then only ever hold what the
+    workers can start, so one user's burst waits in its own line.
+
+    `send(task_name, args, kwargs, queue)` hands a job to Celery.
+    `on_unsent(job_id, error)` is told about jobs given up on after
+    SEND_ATTEMPTS failed sends.
+    """
+
+    def __init__(self, r, send, on_unsent=None):
+        self.r = r
+        self.send = send
+        self.on_unsent = on_unsent
+
+    def submit(
+        self,
+        job_id: str,
+        user: str,
+        tier: str,
+        task_name: str,
+        args,
+        kwargs=None,
+        cost: int = 1,
+        capped: bool = True,
+    ) -> None:
+        """
+        Queues a Celery task call for `user`; `cost` weighs it in the fair
+        share (a batch costs its item count). `capped=False` exempts it
+        from USER_MAX_INFLIGHT, for a `user` that may stand for many people.
+        """
+        key = spec_key(job_id)
+        pipe = self.r.pipeline()
+        pipe.hset(
+            key,
+            mapping={
+                "task": task_name,
+                "args": json.dumps(args),
+                "kwargs": json.dumps(kwargs or {}),
+                "enqueued": time.time(),
+            },
+        )
+        pipe.expire(key, JOB_SPEC_TTL)
+        pipe.execute()
+        keys = tier_keys(tier)
+        self.r.eval(
+            ENQUEUE_SCRIPT, len(keys), *keys, tier, user, job_id, cost, int(capped)
+        )
+        self.dispatch(tier)
+
+    def dispatch(self, tier: str) -> list:
+        """
+        Hands Celery as many waiting jobs as the tier has free slots.
+        """
+        keys = tier_keys(tier)
+        picked = self.r.eval(
+            DISPATCH_SCRIPT,
+            len(keys),
+            *keys,
+            tier,
+            TIER_SLOTS[tier],
+            USER_MAX_INFLIGHT,
+            LEASE_SECONDS,
+        )
+        for job_id in picked:
+            spec = self.r.hmget(spec_key(job_id), "task", "args", "kwargs")
+            try:
+                self.send(spec[0], json.loads(spec[1]), json.loads(spec[2]), tier)
+            except Exception as e:
+                # the broker refused it (or the spec expired): free the slot
+                # and try again on a later dispatch, up to SEND_ATTEMPTS
+                requeued = self.r.eval(
+                    REQUEUE_SCRIPT, len(keys), *keys, job_id, SEND_ATTEMPTS
+                )
+                if not requeued:
+                    self.r.delete(spec_key(job_id))
+                    if self.on_unsent is not None:
+                        self.on_unsent(job_id, e)
+        return picked
+
+    def dispatch_all(self) -> None:
+        for tier in TIER_SLOTS:
+            self.dispatch(tier)
+
+    def start_dispatcher(self, interval: float = DISPATCH_INTERVAL):
+        """
+        Runs dispatch_all every `interval` seconds on a daemon thread.
+        Dispatch is atomic in Redis, so every worker may run one.
+        """
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dispatch_all()
+                except Exception:
+                    # Redis unavailable; the next tick tries again
+                    pass
+
+        thread = threading.Thread(target=loop, name="fairq-dispatch", daemon=True)
+        thread.start()
+        return thread
+
+    def touch(self, job_id: str) -> None:
+        """
+        Renews a running job's slot lease.
+        """
+        self.r.eval(TOUCH_SCRIPT, 1, RUNNING_KEY, job_id, LEASE_SECONDS)
+
+    def release(self, job_id: str) -> None:
+        """
+        Frees a finished job's slots and dispatches the next jobs.
+        """
+        self.r.delete(spec_key(job_id))
+        keys = self._keys(job_id)
+        if keys is None:
+            return
+        tier = self.r.eval(RELEASE_SCRIPT, len(keys), *keys, job_id)
+        if tier:
+            self.dispatch(tier)
+
+    def position(self, job_id: str):
+        keys = self._keys(job_id)
+        if keys is None:
+            return None
+        return queue_entry(self.r.eval(POSITION_SCRIPT, len(keys), *keys, job_id))
+
+    def _keys(self, job_id: str):
+        # the scripts' KEYS for the tier the job is queued or running in
+        raw = self.r.hget(JOBS_KEY, job_id)
+        return tier_keys(json.loads(raw)["tier"]) if raw else None
@@ -0,0 +1,90 @@
+# flask_app/jd_boilerplate.py
+import os
+
+# a sentence found in this many distinct postings is treated as boilerplate
+JD_BOILERPLATE_MIN_POSTINGS = int(os.environ.get("JD_BOILERPLATE_MIN_POSTINGS", 5))
+JD_BOILERPLATE_MAX_SENTENCES = int(
+    os.environ.get("JD_BOILERPLATE_MAX_SENTENCES", 50000)
+)
+# how long submitted postings and users' sentences are remembered, so
+# resubmitting (or re-tailoring) a posting never counts it twice
+JD_BOILERPLATE_SOURCE_TTL = 60 * 60 * 24 * 30
+
+# KEYS: user set, posting marker, counts
+# ARGV: ttl, max sentences, sentence keys...
+# Counts each sentence once per posting and once per user: a posting
+# already seen counts nothing, and neither does a user resubmitting their
+# sentences with another posting.
+LEARN_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+if not redis.call('SET', KEYS[2], 1, 'NX', 'EX', ttl) then
+  return 0
+end
+for i = 3, #ARGV do
+  if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+    redis.call('ZINCRBY', KEYS[3], 1, ARGV[i])
+  end
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -tonumber(ARGV[2]) - 1)
+return 1
+"""
+
+
+class BoilerplateIndex:
+    """
+    Learned complement to the curated patterns in prompt_compaction:
+    counts, per sentence key, how many distinct postings contained it.
+    Company blurbs and legal footers repeat across a company's postings,
+    while a popular posting submitted by many users counts once, as does
+    one user resubmitting or re-tailoring a posting.
+    Callers only pass sentences outside the requirement sections
+    (PreprocessedJD.learnable_keys).
+
+    The count zset is trimmed to the `max_sentences` most frequent keys.
+    """
+
+    def __init__(
+        self,
+        r,
+        namespace: str = "jd_boilerplate",
+        min_postings: int = JD_BOILERPLATE_MIN_POSTINGS,
+        max_sentences: int = JD_BOILERPLATE_MAX_SENTENCES,
+    ):
+        self.r = r
+        self.namespace = namespace
+        self.min_postings = min_postings
+        self.max_sentences = max_sentences
+        self.counts_key = f"{namespace}:counts"
+
+    def known(self, keys) -> set:
+        """
+        The subset of `keys` found in at least `min_postings` postings.
+        """
+        keys = list(keys)
+        if not keys:
+            return set()
+        scores = self.r.zmscore(self.counts_key, keys)
+        return {
+            key
+            for key, score in zip(keys, scores)
+            if score is not None and score >= self.min_postings
+        }
+
+    def learn(self, user: str, posting: str, keys) -> None:
+        """
+        Counts the sentences `user` submitted in the posting whose content
+        key is `posting`, unless that posting was counted already.
+        """
+        if not user or not keys:
+            return
+        self.r.eval(
+            LEARN_SCRIPT,
+            3,
+            f"{self.namespace}:user:{user}",
+            f"{self.namespace}:posting:{posting}",
+            self.counts_key,
+            JD_BOILERPLATE_SOURCE_TTL,
+            self.max_sentences,
+            *set(keys),
+        )
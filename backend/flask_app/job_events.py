@@ -0,0 +1,20 @@
+# flask_app/job_events.py
+from status_api import encode
+
+# "partial": a batch that finished with some of its items failed
+TERMINAL_STATUSES = ("completed", "failed", "partial")
+
+
+def job_channel(job_id: str) -> str:
+    return f"job-events:{job_id}"
+
+
+def publish_status(r, job_id: str, data: dict) -> None:
+    """
+    Pushes a job status record to subscribers of the job's channel.
+    """
+    r.publish(job_channel(job_id), encode(data))
+
+
+def format_sse(data: str) -> str:
+    return f"data: {data}\n\n"
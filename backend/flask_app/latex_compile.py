@@ -1,31 +1,257 @@
 import subprocess
 import os
+import re
+import hashlib
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional
 
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.instrumentation import timed
 
-def compile_latex(tex_path: str) -> str:
+# precompiled .fmt files for known preambles, shared by all workers on a host
+FORMAT_DIR = os.environ.get(
+    "LATEX_FORMAT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "resume_tailor", "latex_formats"),
+)
+# concurrent pdflatex processes per worker process
+COMPILE_SLOTS = int(os.environ.get("LATEX_COMPILE_SLOTS", 2))
+COMPILE_TIMEOUT = int(os.environ.get("LATEX_COMPILE_TIMEOUT", 60))
+MAX_PASSES = 3
+
+BEGIN_DOCUMENT = r"\begin{document}"
+
+_PAGES_RE = re.compile(r"Output written on .*?\((\d+) pages?", re.S)
+_OVERFULL_RE = re.compile(r"Overfull \\[hv]box \(([\d.]+)pt too (?:wide|high)\)")
+_WARNING_RE = re.compile(r"^(?:LaTeX|Package \w+) Warning: (.*)$", re.M)
+_ERROR_RE = re.compile(r"^! (.*)$", re.M)
+_ERROR_LINE_RE = re.compile(r"^l\.(\d+) ?(.*)$", re.M)
+_RERUN_RE = re.compile(r"Rerun to get|may have changed\.\s*Rerun")
+
+_slots = threading.BoundedSemaphore(COMPILE_SLOTS)
+_format_lock = threading.Lock()
+_formats = {}  # preamble hash → format name
+
+
+@dataclass
+class CompileResult:
+    tex_path: str
+    pdf_path: Optional[str] = None
+    returncode: int = 0
+    passes: int = 0
+    used_format: bool = False
+    pages: int = 0
+    errors: List[dict] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    overfull_pt: List[float] = field(default_factory=list)
+    log: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and self.pdf_path is not None
+
+    def diagnostics(self) -> dict:
+        return {
+            "ok": self.ok,
+            "pages": self.pages,
+            "passes": self.passes,
+            "used_format": self.used_format,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "overfull_pt": self.overfull_pt,
+        }
+
+    def raise_for_errors(self) -> "CompileResult":
+        if not self.ok:
+            raise LatexCompileError(self)
+        return self
+
+
+class LatexCompileError(RuntimeError):
+    def __init__(self, result: CompileResult):
+        self.result = result
+        if result.errors:
+            first = result.errors[0]
+            detail = f"line {first['line']}: {first['message']}"
+        else:
+            detail = "PDF not generated"
+        super().__init__(f"LaTeX compilation failed ({detail})")
+
+
+def parse_log(log: str) -> dict:
     """
-    Compiles .tex into PDF using pdflatex.
-    Returns PDF file path.
+    Extracts errors (with source line), warnings, overfull boxes and the
+    page count from a pdflatex log.
+    """
+    errors = []
+    for match in _ERROR_RE.finditer(log):
+        line = _ERROR_LINE_RE.search(log, match.end())
+        errors.append(
+            {
+                "message": match.group(1).strip(),
+                "line": int(line.group(1)) if line else None,
+                "context": line.group(2).strip() if line else "",
+            }
+        )
+
+    pages = _PAGES_RE.search(log)
+    return {
+        "pages": int(pages.group(1)) if pages else 0,
+        "errors": errors,
+        "warnings": [w.strip() for w in _WARNING_RE.findall(log)],
+        "overfull_pt": [float(pt) for pt in _OVERFULL_RE.findall(log)],
+    }
+
+
+def _format_name(preamble: str) -> str:
+    digest = hashlib.sha256(preamble.strip().encode("utf-8")).hexdigest()[:16]
+    return f"preamble-{digest}"
+
+
+def precompile_format(preamble: str) -> Optional[str]:
+    """
+    Dumps `preamble` (everything before \\begin{document}) into a .fmt so
+    later compiles skip loading the class and packages. Documents whose
+    preamble matches are compiled against it automatically.
+    Returns the format name, or None if the format could not be built.
+    """
+    name = _format_name(preamble)
+    with _format_lock:
+        if name in _formats:
+            return _formats[name]
+
+        fmt_path = os.path.join(FORMAT_DIR, name + ".fmt")
+        if not os.path.exists(fmt_path):
+            os.makedirs(FORMAT_DIR, exist_ok=True)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                with open(os.path.join(tmpdir, name + ".tex"), "w") as f:
+                    f.write(preamble.strip() + "\n\\dump\n")
+                proc = subprocess.run(
+                    [
+                        "pdflatex",
+                        "-ini",
+                        "-interaction=nonstopmode",
+                        f"-jobname={name}",
+                        "&pdflatex",
+                        name + ".tex",
+                    ],
+                    cwd=tmpdir,
+                    capture_output=True,
+                    timeout=COMPILE_TIMEOUT,
+                )
+                built = os.path.join(tmpdir, name + ".fmt")
+                if proc.returncode != 0 or not os.path.exists(built):
+                    _formats[name] = None
+                    return None
+                # atomic, so workers racing on the same format never see half a file
+                os.replace(built, fmt_path)
+
+        _formats[name] = name
+        return name
+
+
+def _known_format(preamble: str) -> Optional[str]:
+    return _formats.get(_format_name(preamble))
+
+
+def _run_pdflatex(workdir: str, base: str, source: str, fmt: Optional[str]):
+    cmd = ["pdflatex", "-interaction=nonstopmode", f"-jobname={base}"]
+    env = None
+    if fmt:
+        cmd.append(f"-fmt={fmt}")
+        env = {**os.environ, "TEXFORMATS": FORMAT_DIR + os.pathsep}
+    cmd.append(source)
+
+    with timed("pdflatex", "format" if fmt else "plain"):
+        proc = subprocess.run(
+            cmd,
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            timeout=COMPILE_TIMEOUT,
+        )
+    log_path = os.path.join(workdir, base + ".log")
+    if os.path.exists(log_path):
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            log = f.read()
+    else:
+        log = proc.stdout.decode("utf-8", errors="replace")
+    return proc.returncode, log
+
+
+def _run_passes(workdir: str, base: str, source: str, fmt: Optional[str]):
+    passes = 0
+    for _ in range(MAX_PASSES):
+        returncode, log = _run_pdflatex(workdir, base, source, fmt)
+        passes += 1
+        if returncode != 0 or not _RERUN_RE.search(log):
+            break
+    return returncode, log, passes
+
+
+def compile_document(tex_path: str) -> CompileResult:
+    """
+    Compiles .tex into PDF and returns structured diagnostics.
+    Uses a precompiled format when the preamble has one, and only runs
+    another pass when the log asks for it.
     """
     if not os.path.exists(tex_path):
         raise FileNotFoundError(tex_path)
 
     workdir = os.path.dirname(tex_path)
     tex_file = os.path.basename(tex_path)
+    base = os.path.splitext(tex_file)[0]
+
+    with open(tex_path, encoding="utf-8") as f:
+        tex = f.read()
+
+    source = tex_file
+    fmt = None
+    preamble, sep, rest = tex.partition(BEGIN_DOCUMENT)
+    if sep:
+        fmt = _known_format(preamble)
+        if fmt:
+            # the format already holds the preamble; feed it only the body
+            source = base + ".body.tex"
+            with open(os.path.join(workdir, source), "w", encoding="utf-8") as f:
+                f.write(sep + rest)
 
-    cmd = ["pdflatex", "-interaction=nonstopmode", tex_file]
+    result = CompileResult(tex_path=tex_path)
+    with _slots:
+        result.returncode, result.log, result.passes = _run_passes(
+            workdir, base, source, fmt
+        )
+        result.used_format = bool(fmt)
+        if fmt and result.returncode != 0:
+            # some packages misbehave when dumped; retry the plain way
+            result.returncode, result.log, result.passes = _run_passes(
+                workdir, base, tex_file, None
+            )
+            result.used_format = False
 
-    subprocess.run(
-        cmd,
-        cwd=workdir,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        check=True,
-    )
+    parsed = parse_log(result.log)
+    result.pages = parsed["pages"]
+    result.errors = parsed["errors"]
+    result.warnings = parsed["warnings"]
+    result.overfull_pt = parsed["overfull_pt"]
+    if result.used_format:
+        # map body-file line numbers back onto the full document
+        offset = preamble.count("\n")
+        for error in result.errors:
+            if error["line"] is not None:
+                error["line"] += offset
 
-    pdf_path = tex_path.replace(".tex", ".pdf")
+    pdf_path = os.path.join(workdir, base + ".pdf")
+    if os.path.exists(pdf_path):
+        result.pdf_path = pdf_path
 
-    if not os.path.exists(pdf_path):
-        raise RuntimeError("PDF not generated")
+    return result
 
-    return pdf_path
+
+def compile_latex(tex_path: str) -> str:
+    """
+    Compiles .tex into PDF using pdflatex.
+    Returns PDF file path; raises LatexCompileError with diagnostics on failure.
+    """
+    return compile_document(tex_path).raise_for_errors().pdf_path
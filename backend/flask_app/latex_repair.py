@@ -0,0 +1,233 @@
+# flask_app/latex_repair.py
+import os
+import re
+
+from latex_compile import BEGIN_DOCUMENT, LatexCompileError, compile_document
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.crew import repair_llm
+from resume_tailor.instrumentation import timed
+
+LATEX_REPAIR_ROUNDS = int(os.environ.get("LATEX_REPAIR_ROUNDS", 4))
+# snippets sent to the repair model per document; 0 keeps repairs local
+LATEX_REPAIR_LLM_ATTEMPTS = int(os.environ.get("LATEX_REPAIR_LLM_ATTEMPTS", 2))
+# lines of context on each side of the failing line in an LLM snippet
+LATEX_REPAIR_CONTEXT_LINES = 6
+
+END_DOCUMENT = r"\end{document}"
+
+_FENCE_LINE_RE = re.compile(r"^[ \t]*```[A-Za-z]*[ \t]*$\n?", re.M)
+_ENV_RE = re.compile(r"\\(begin|end)\{([^}]+)\}")
+_MACRO_RE = re.compile(r"\\[A-Za-z]+\*?")
+_UNESCAPED_DOLLAR_RE = re.compile(r"(?<!\\)\$")
+_UNESCAPED_PERCENT_RE = re.compile(r"(?<!\\)%")
+# a number in running text, not one ending a macro or an assignment
+_TEXT_NUMBER_RE = re.compile(r"(?<![\w\\=.,])\d+(?:[.,]\d+)?$")
+
+# pdflatex error message → characters to escape on the failing line
+_ESCAPE_FOR = [
+    ("Misplaced alignment tab character", "&"),
+    ("Missing $ inserted", "_^"),
+    ("macro parameter character #", "#"),
+    ("Illegal parameter number", "#"),
+]
+_ESCAPED = {"&": r"\&", "#": r"\#", "_": r"\_", "^": r"\^{}"}
+
+REPAIR_PROMPT = """The LaTeX lines below fail to compile with pdflatex.
+Error: {message}
+Failing line (marked with %<<): {context}
+
+Return only the corrected lines: the same content with the LaTeX fixed, no
+code fences and no explanation. Do not add packages or change the wording.
+
+{snippet}"""
+
+
+def strip_code_fences(tex: str) -> str:
+    """
+    Drops markdown fences and any chatter outside \\documentclass …
+    \\end{document}, as LLM-written documents often carry them.
+    """
+    tex = _FENCE_LINE_RE.sub("", tex)
+    start = tex.find(r"\documentclass")
+    if start > 0:
+        tex = tex[start:]
+    end = tex.rfind(END_DOCUMENT)
+    if end >= 0:
+        tex = tex[: end + len(END_DOCUMENT)] + "\n"
+    return tex
+
+
+def _escape_outside_math(line: str, chars: str) -> str:
+    # even segments between unescaped $ are text, odd ones math
+    parts = _UNESCAPED_DOLLAR_RE.split(line)
+    for i in range(0, len(parts), 2):
+        for char in chars:
+            parts[i] = re.sub(
+                rf"(?<!\\){re.escape(char)}", lambda _: _ESCAPED[char], parts[i]
+            )
+    return "$".join(parts)
+
+
+def escape_text_percents(line: str) -> str:
+    """
+    Escapes the % of numbers in text ("grew 50% in"), which comments out
+    the rest of the line. The first % that is not one of them starts a
+    real comment and ends the scan; so do %% and a % ending the line.
+    """
+    out, pos = [], 0
+    for match in _UNESCAPED_PERCENT_RE.finditer(line):
+        after = line[match.end() : match.end() + 1]
+        if after in ("", "%") or not _TEXT_NUMBER_RE.search(line[: match.start()]):
+            break
+        out.append(line[pos : match.start()] + r"\%")
+        pos = match.end()
+    return "".join(out) + line[pos:]
+
+
+def balance_environments(tex: str) -> str:
+    """
+    Removes \\end{x} with no open x, closes environments left open before
+    \\end{document}, and adds \\end{document} when it is missing.
+    """
+    head, sep, body = tex.partition(BEGIN_DOCUMENT)
+    if not sep:
+        return tex
+    body, has_end, tail = body.partition(END_DOCUMENT)
+
+    out, stack, pos, changed = [], [], 0, False
+    for match in _ENV_RE.finditer(body):
+        kind, name = match.groups()
+        out.append(body[pos : match.start()])
+        pos = match.end()
+        if kind == "begin":
+            stack.append(name)
+            out.append(match.group(0))
+        elif name in stack:
+            # close whatever was opened inside and left open
+            while stack[-1] != name:
+                out.append(rf"\end{{{stack.pop()}}}")
+                changed = True
+            stack.pop()
+            out.append(match.group(0))
+        else:
+            changed = True  # a stray \end, dropped
+    if not (changed or stack) and has_end:
+        return tex
+    out.append(body[pos:])
+    closing = "".join(rf"\end{{{name}}}" + "\n" for name in reversed(stack))
+    body = "".join(out).rstrip("\n") + "\n" + closing
+    return head + sep + body + END_DOCUMENT + (tail if has_end else "\n")
+
+
+def deterministic_fix(tex: str, errors) -> tuple:
+    """
+    One round of rule-based fixes. Returns the new source and the names of
+    the fixes that changed something.
+    """
+    applied = []
+
+    stripped = strip_code_fences(tex)
+    if stripped != tex:
+        # line numbers in `errors` no longer match; recompile first
+        return stripped, ["code_fences"]
+
+    lines = tex.split("\n")
+    for error in errors:
+        number = error.get("line")
+        if not number or number > len(lines):
+            continue
+        line = lines[number - 1]
+        fixed = line
+        for message, chars in _ESCAPE_FOR:
+            if message in error["message"]:
+                fixed = _escape_outside_math(fixed, chars)
+        if "Undefined control sequence" in error["message"]:
+            # the log cuts the context right after the unknown macro
+            macros = _MACRO_RE.findall(error.get("context", ""))
+            if macros:
+                unknown = re.escape(macros[-1]) + r"(?![A-Za-z])"
+                fixed = re.sub(unknown, "", fixed, count=1)
+        if fixed != line:
+            lines[number - 1] = fixed
+            applied.append(f"line {number}: {error['message']}")
+    tex = "\n".join(lines)
+
+    head, sep, body = tex.partition(BEGIN_DOCUMENT)
+    if sep:
+        escaped = "\n".join(escape_text_percents(line) for line in body.split("\n"))
+        if escaped != body:
+            tex = head + sep + escaped
+            applied.append("percent_signs")
+
+    balanced = balance_environments(tex)
+    if balanced != tex:
+        tex = balanced
+        applied.append("environments")
+    return tex, applied
+
+
+def llm_fix(tex: str, error: dict) -> str:
+    """
+    Sends only the lines around the first located error to the repair
+    model and splices its answer back in.
+    """
+    lines = tex.split("\n")
+    index = error["line"] - 1
+    start = max(0, index - LATEX_REPAIR_CONTEXT_LINES)
+    end = min(len(lines), index + LATEX_REPAIR_CONTEXT_LINES + 1)
+    snippet = lines[start:end]
+    snippet[index - start] += " %<<"
+
+    with timed("repair", "llm"):
+        answer = repair_llm.call(
+            [
+                {
+                    "role": "user",
+                    "content": REPAIR_PROMPT.format(
+                        message=error["message"],
+                        context=error.get("context", ""),
+                        snippet="\n".join(snippet),
+                    ),
+                }
+            ]
+        )
+    fixed = _FENCE_LINE_RE.sub("", str(answer)).strip("\n").replace(" %<<", "")
+    return "\n".join(lines[:start] + fixed.split("\n") + lines[end:])
+
+
+def repair_latex(tex_path: str) -> dict:
+    """
+    Compiles `tex_path` and, while pdflatex fails, rewrites it: rule-based
+    fixes first, then (when those change nothing) the failing snippet goes
+    to the repair model. Raises LatexCompileError if it still fails after
+    LATEX_REPAIR_ROUNDS rounds. Returns what was done.
+    """
+    with open(tex_path, encoding="utf-8") as f:
+        tex = f.read()
+
+    report = {"rounds": 0, "fixes": [], "llm_snippets": 0}
+    result = compile_document(tex_path)
+    while not result.ok:
+        if report["rounds"] >= LATEX_REPAIR_ROUNDS:
+            raise LatexCompileError(result)
+        report["rounds"] += 1
+
+        with timed("repair", "deterministic"):
+            fixed, applied = deterministic_fix(tex, result.errors)
+        located = [e for e in result.errors if e.get("line")]
+        if fixed == tex:
+            if report["llm_snippets"] >= LATEX_REPAIR_LLM_ATTEMPTS or not located:
+                raise LatexCompileError(result)
+            fixed = llm_fix(tex, located[0])
+            report["llm_snippets"] += 1
+            applied = [f"llm: line {located[0]['line']}: {located[0]['message']}"]
+            if fixed == tex:
+                raise LatexCompileError(result)
+
+        report["fixes"] += applied
+        tex = fixed
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(tex)
+        result = compile_document(tex_path)
+
+    return report
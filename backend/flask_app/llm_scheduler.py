@@ -0,0 +1,151 @@
+# flask_app/llm_scheduler.py
+import json
+import os
+import random
+import time
+import uuid
+
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.scheduling import BATCH, INTERACTIVE, LLMScheduler
+
+# Per-model provider ceilings shared by every worker, as JSON, e.g.
+#   LLM_RATE_LIMITS='{"openai/gpt-4o": {"rpm": 500, "tpm": 30000}}'
+# Set them to the account's tier: each call reserves its prompt plus its
+# max_tokens against "tpm" before it starts. Models not listed (all of
+# them by default) are not throttled; provider 429s are still retried with
+# backoff.
+LLM_RATE_LIMITS = json.loads(os.environ.get("LLM_RATE_LIMITS") or "{}")
+# share of each bucket batch work may not touch, kept for interactive jobs
+BATCH_RESERVE = float(os.environ.get("LLM_BATCH_RESERVE", 0.2))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+LLM_ACQUIRE_TIMEOUT = float(os.environ.get("LLM_ACQUIRE_TIMEOUT", 900))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# interactive waiters count as gone if they stop refreshing this long
+WAITER_TTL = 30
+BATCH_YIELD_SECONDS = 0.25
+
+# KEYS: bucket hash, backoff key
+# ARGV: rpm, tpm, tokens, reserve fraction (0 for interactive calls)
+# Returns the seconds to wait as a string (0 = granted).
+ACQUIRE_SCRIPT = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+  return tostring(pause / 1000)
+end
+
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts')
+local req = tonumber(state[1]) or rpm
+local tok = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+req = math.min(rpm, req + elapsed * rpm / 60)
+tok = math.min(tpm, tok + elapsed * tpm / 60)
+
+-- a call bigger than the usable bucket runs once the bucket is full
+cost = math.min(cost, tpm * (1 - reserve))
+local need_req = 1 + reserve * rpm
+local need_tok = cost + reserve * tpm
+local wait = 0
+if req < need_req then
+  wait = math.max(wait, (need_req - req) * 60 / rpm)
+end
+if tok < need_tok then
+  wait = math.max(wait, (need_tok - tok) * 60 / tpm)
+end
+if wait == 0 then
+  req = req - 1
+  tok = tok - cost
+end
+redis.call('HSET', KEYS[1], 'req', req, 'tok', tok, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+
+class RedisLLMScheduler(LLMScheduler):
+    """
+    Token buckets on requests/min and tokens/min per model, shared by every
+    worker through Redis.
+
+    Batch calls leave BATCH_RESERVE of each bucket untouched and yield
+    while an interactive call is waiting. A provider 429 pauses the model
+    for every worker (Retry-After when given, exponential backoff
+    otherwise), so the fleet slows down together instead of retrying at once.
+    """
+
+    max_retries = LLM_MAX_RETRIES
+
+    def __init__(self, r, limits=None):
+        self.r = r
+        self.limits = LLM_RATE_LIMITS if limits is None else limits
+        self._acquire = r.register_script(ACQUIRE_SCRIPT)
+
+    @staticmethod
+    def _keys(model: str):
+        return f"llm_bucket:{model}", f"llm_backoff:{model}"
+
+    def acquire(self, model: str, tokens: int, priority: str) -> None:
+        limit = self.limits.get(model)
+        if not limit:
+            # unthrottled, but still held back by a 429 pause on the model
+            pause = self.r.pttl(f"llm_backoff:{model}")
+            if pause > 0:
+                time.sleep(pause / 1000 * random.uniform(1.0, 1.2))
+            return
+
+        keys = self._keys(model)
+        waiters = f"llm_waiting:{model}"
+        waiter_id = uuid.uuid4().hex
+        reserve = BATCH_RESERVE if priority == BATCH else 0.0
+        deadline = time.monotonic() + LLM_ACQUIRE_TIMEOUT
+        try:
+            while True:
+                if priority == BATCH and self.r.zcount(
+                    waiters, time.time() - WAITER_TTL, "+inf"
+                ):
+                    # an interactive call is queued for this model: let it go first
+                    wait = BATCH_YIELD_SECONDS
+                else:
+                    wait = float(
+                        self._acquire(
+                            keys=keys,
+                            args=[limit["rpm"], limit["tpm"], tokens, reserve],
+                        )
+                    )
+                if wait <= 0:
+                    return
+                if time.monotonic() + wait > deadline:
+                    raise TimeoutError(
+                        f"no {model} capacity within {LLM_ACQUIRE_TIMEOUT}s"
+                    )
+                if priority == INTERACTIVE:
+                    pipe = self.r.pipeline()
+                    pipe.zadd(waiters, {waiter_id: time.time()})
+                    pipe.zremrangebyscore(waiters, "-inf", time.time() - WAITER_TTL)
+                    pipe.expire(waiters, WAITER_TTL)
+                    pipe.execute()
+                # jitter so workers woken together don't collide again
+                time.sleep(min(wait, 5.0) * random.uniform(1.0, 1.2))
+        finally:
+            if priority == INTERACTIVE:
+                self.r.zrem(waiters, waiter_id)
+
+    def settle(self, model: str, extra_tokens: int) -> None:
+        if model in self.limits:
+            self.r.hincrbyfloat(f"llm_bucket:{model}", "tok", -extra_tokens)
+
+    def backoff(self, model: str, retry_after, attempt: int) -> None:
+        if retry_after is None:
+            retry_after = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)
+        pause_ms = int(retry_after * 1000 * random.uniform(1.0, 1.2))
+        key = f"llm_backoff:{model}"
+        # never shorten a pause another worker already set
+        if pause_ms > self.r.pttl(key):
+            self.r.set(key, 1, px=pause_ms)
@@ -0,0 +1,92 @@
+# flask_app/metrics.py
+# Redis hashes shared by all workers; the API renders them on /metrics
+HISTOGRAM_KEY = "metrics:seconds"
+TOKENS_KEY = "metrics:tokens"
+JOBS_KEY = "metrics:jobs"
+
+# seconds; covers a single pdflatex pass up to a slow LLM stage
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+METRIC_PREFIX = "resume_tailor"
+
+
+def _bucket(seconds: float) -> str:
+    for le in LATENCY_BUCKETS:
+        if seconds <= le:
+            return f"{le:g}"
+    return "+Inf"
+
+
+def observe(r, spans, status=None) -> None:
+    """
+    Folds a job's spans into the shared histograms and token counters.
+    Series are labelled by span kind and name (task, model, tool, …).
+    """
+    pipe = r.pipeline(transaction=False)
+    for span in spans:
+        series = f"{span['kind']}|{span['name']}"
+        pipe.hincrby(HISTOGRAM_KEY, f"{series}|{_bucket(span['seconds'])}", 1)
+        pipe.hincrbyfloat(HISTOGRAM_KEY, f"{series}|sum", span["seconds"])
+        for field in ("prompt_tokens", "completion_tokens", "saved_tokens"):
+            if span.get(field):
+                pipe.hincrby(TOKENS_KEY, f"{series}|{field}", span[field])
+    if status is not None:
+        pipe.hincrby(JOBS_KEY, status, 1)
+    pipe.execute()
+
+
+def _labels(**labels) -> str:
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + body + "}"
+
+
+def render_prometheus(r) -> str:
+    """
+    Prometheus text exposition of the aggregated histograms and counters.
+    """
+    histograms = {}
+    for field, value in r.hgetall(HISTOGRAM_KEY).items():
+        kind, name, bucket = field.rsplit("|", 2)
+        series = histograms.setdefault((kind, name), {"buckets": {}, "sum": 0.0})
+        if bucket == "sum":
+            series["sum"] = float(value)
+        else:
+            series["buckets"][bucket] = int(value)
+
+    seconds = f"{METRIC_PREFIX}_stage_seconds"
+    lines = [
+        f"# HELP {seconds} Wall time of crew tasks, LLM calls, tools, pdflatex runs and uploads.",
+        f"# TYPE {seconds} histogram",
+    ]
+    for (kind, name), series in sorted(histograms.items()):
+        cumulative = 0
+        for le in [f"{b:g}" for b in LATENCY_BUCKETS] + ["+Inf"]:
+            cumulative += series["buckets"].get(le, 0)
+            labels = _labels(kind=kind, name=name, le=le)
+            lines.append(f"{seconds}_bucket{labels} {cumulative}")
+        labels = _labels(kind=kind, name=name)
+        lines.append(f"{seconds}_sum{labels} {series['sum']:.6f}")
+        lines.append(f"{seconds}_count{labels} {cumulative}")
+
+    tokens = f"{METRIC_PREFIX}_tokens_total"
+    lines += [
+        f"# HELP {tokens} LLM tokens by span and type (saved: cut by compaction).",
+        f"# TYPE {tokens} counter",
+    ]
+    for field, value in sorted(r.hgetall(TOKENS_KEY).items()):
+        kind, name, token_type = field.rsplit("|", 2)
+        labels = _labels(kind=kind, name=name, type=token_type.replace("_tokens", ""))
+        lines.append(f"{tokens}{labels} {value}")
+
+    jobs = f"{METRIC_PREFIX}_jobs_total"
+    lines += [
+        f"# HELP {jobs} Finished job attempts, by outcome.",
+        f"# TYPE {jobs} counter",
+    ]
+    for status, value in sorted(r.hgetall(JOBS_KEY).items()):
+        lines.append(f"{jobs}{_labels(status=status)} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,67 @@
+# flask_app/one_page_fit.py
+import os
+from dataclasses import asdict
+
+from latex_compile import compile_document
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.latex_renderer import LAYOUT_LADDER, apply_layout
+
+# overfull boxes up to this width are invisible in practice
+OVERFULL_TOLERANCE_PT = float(os.environ.get("OVERFULL_TOLERANCE_PT", 2))
+
+
+def _fits(result) -> bool:
+    overfull = max(result.overfull_pt, default=0.0)
+    return result.pages == 1 and overfull <= OVERFULL_TOLERANCE_PT
+
+
+def fit_one_page(tex_path: str, ladder=LAYOUT_LADDER) -> dict:
+    """
+    Compiles `tex_path` and tightens its layout until the PDF is one page.
+
+    Binary-searches `ladder` (loosest → tightest) for the loosest layout
+    whose compiled PDF has exactly one page and no visible overfull boxes,
+    as reported by the compile diagnostics. If none fits, the tightest layout
+    is kept. The .tex on disk ends up matching the returned PDF.
+    """
+    with open(tex_path, encoding="utf-8") as f:
+        base_tex = f.read()
+
+    attempts = {}
+    on_disk = None
+    compiles = 0
+
+    def attempt(level: int):
+        nonlocal on_disk, compiles
+        if level in attempts and on_disk == level:
+            return attempts[level]
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(apply_layout(base_tex, ladder[level]))
+        on_disk = level
+        compiles += 1
+        attempts[level] = compile_document(tex_path).raise_for_errors()
+        return attempts[level]
+
+    best = None
+    if _fits(attempt(0)):
+        best = 0
+    else:
+        lo, hi = 1, len(ladder) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if _fits(attempt(mid)):
+                best, hi = mid, mid - 1
+            else:
+                lo = mid + 1
+
+    level = best if best is not None else len(ladder) - 1
+    result = attempt(level)
+
+    return {
+        "pdf_path": result.pdf_path,
+        "pages": result.pages,
+        "fitted": best is not None,
+        "level": level,
+        "layout": asdict(ladder[level]),
+        "compiles": compiles,
+    }
@@ -0,0 +1,78 @@
+# flask_app/result_cache.py
+import json
+import os
+import time
+
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.crew import pipeline_fingerprint
+from stage_cache import StageCache, content_key, normalize_text
+from supabase_upload import sign_tex_url
+
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 60 * 60 * 24 * 30))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 5000))
+# how long /start-job trusts that a resume URL still serves the same bytes;
+# past that only the worker, which hashes the downloaded PDF, can hit
+RESULT_CACHE_URL_TTL = int(os.environ.get("RESULT_CACHE_URL_TTL", 3600))
+
+
+class ResultCache:
+    """
+    Finished-job payloads keyed by the resume PDF's bytes, the normalised
+    JD and the pipeline fingerprint (prompts, models, temperatures, LaTeX
+    mode and renderer). Entries live in a StageCache namespace, so they
+    share its TTL, LRU eviction and hit/miss stats.
+
+    The .tex is stored by object path rather than signed URL and re-signed
+    on every hit (sign_tex_url renews it near SIGNED_URL_EXPIRY).
+    `variant` folds in worker settings that change the output.
+    """
+
+    stage = "pipeline"
+
+    def __init__(self, r, variant: str = ""):
+        self.r = r
+        self.cache = StageCache(
+            r,
+            namespace="result_cache",
+            ttl=RESULT_CACHE_TTL,
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+        )
+        self.fingerprint = content_key(pipeline_fingerprint(), variant)
+
+    def key(self, pdf_bytes: bytes, text: str) -> str:
+        return content_key(pdf_bytes, normalize_text(text), self.fingerprint)
+
+    def _url_key(self, pdf_url: str, text: str) -> str:
+        alias = content_key(pdf_url.strip(), normalize_text(text), self.fingerprint)
+        return f"result_cache:url:{alias}"
+
+    def get(self, key: str):
+        """
+        The stored payload with a current tex_url, or None.
+        """
+        raw = self.cache.get(self.stage, key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        payload = dict(entry["payload"])
+        payload["tex_url"] = sign_tex_url(entry["tex_object"], self.r)
+        payload["cached"] = True
+        return payload
+
+    def get_by_url(self, pdf_url: str, text: str):
+        """
+        Lookup for the API, which has the URL but not the PDF.
+        """
+        key = self.r.get(self._url_key(pdf_url, text))
+        return self.get(key) if key else None
+
+    def put(self, key: str, payload: dict, tex_object: str) -> None:
+        entry = {"payload": payload, "tex_object": tex_object, "stored_at": time.time()}
+        self.cache.put(self.stage, key, json.dumps(entry))
+
+    def remember_url(self, pdf_url: str, text: str, key: str) -> None:
+        if RESULT_CACHE_URL_TTL > 0:
+            self.r.set(self._url_key(pdf_url, text), key, ex=RESULT_CACHE_URL_TTL)
+
+    def stats(self) -> dict:
+        return self.cache.stats().get(self.stage, {"hits": 0, "misses": 0})
@@ -0,0 +1,53 @@
+# flask_app/single_flight.py
+import os
+from stage_cache import content_key, normalize_text
+
+# how long a completed job is handed back for identical submissions
+DEDUPE_WINDOW_SECONDS = int(os.environ.get("DEDUPE_WINDOW_SECONDS", 600))
+# safety net in case a worker dies without releasing its claim
+INFLIGHT_TTL = 60 * 60 * 2
+
+# delete the in-flight claim only if it still belongs to this job
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def job_fingerprint(pdf_url: str, text: str) -> str:
+    return content_key(pdf_url.strip(), normalize_text(text))
+
+
+def recent_job(r, fingerprint: str):
+    """
+    Returns the id of a job with this fingerprint that completed within
+    the dedupe window, if any.
+    """
+    return r.get(f"recent:{fingerprint}")
+
+
+def claim(r, fingerprint: str, job_id: str, force: bool = False):
+    """
+    Marks `job_id` as the in-flight job for `fingerprint`.
+    Returns the id of the job already holding the claim, or None if
+    `job_id` now owns it. `force` takes over a stale claim.
+    """
+    key = f"inflight:{fingerprint}"
+    if force:
+        r.set(key, job_id, ex=INFLIGHT_TTL)
+        return None
+    if r.set(key, job_id, nx=True, ex=INFLIGHT_TTL):
+        return None
+    return r.get(key)
+
+
+def release(r, fingerprint: str, job_id: str, completed: bool) -> None:
+    """
+    Drops the in-flight claim once the job ends; completed jobs are
+    remembered for DEDUPE_WINDOW_SECONDS.
+    """
+    r.eval(_RELEASE_SCRIPT, 1, f"inflight:{fingerprint}", job_id)
+    if completed and DEDUPE_WINDOW_SECONDS > 0:
+        r.set(f"recent:{fingerprint}", job_id, ex=DEDUPE_WINDOW_SECONDS)
@@ -0,0 +1,88 @@
+# flask_app/stage_cache.py
+import os
+import time
+import hashlib
+
+STAGE_CACHE_TTL = int(os.environ.get("STAGE_CACHE_TTL", 60 * 60 * 24 * 7))
+STAGE_CACHE_MAX_ENTRIES = int(os.environ.get("STAGE_CACHE_MAX_ENTRIES", 10000))
+
+
+def content_key(*parts) -> str:
+    """
+    Builds a content-addressed key from strings/bytes.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class StageCache:
+    """
+    Redis-backed cache for crew stage outputs.
+
+    Entries expire after `ttl` seconds and are touched on every hit; once
+    more than `max_entries` exist the least recently used ones are evicted.
+    Hit/miss counters per stage live in the `{namespace}:stats` hash.
+    """
+
+    def __init__(
+        self,
+        r,
+        namespace: str = "stage_cache",
+        ttl: int = STAGE_CACHE_TTL,
+        max_entries: int = STAGE_CACHE_MAX_ENTRIES,
+    ):
+        self.r = r
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lru_key = f"{namespace}:lru"
+        self.stats_key = f"{namespace}:stats"
+
+    def _entry_key(self, stage: str, key: str) -> str:
+        return f"{self.namespace}:{stage}:{key}"
+
+    def get(self, stage: str, key: str):
+        entry = self._entry_key(stage, key)
+        value = self.r.get(entry)
+        pipe = self.r.pipeline()
+        if value is None:
+            pipe.hincrby(self.stats_key, f"{stage}:misses", 1)
+            pipe.zrem(self.lru_key, entry)
+        else:
+            pipe.hincrby(self.stats_key, f"{stage}:hits", 1)
+            pipe.expire(entry, self.ttl)
+            pipe.zadd(self.lru_key, {entry: time.time()})
+        pipe.execute()
+        return value
+
+    def put(self, stage: str, key: str, value: str) -> None:
+        entry = self._entry_key(stage, key)
+        pipe = self.r.pipeline()
+        pipe.set(entry, value, ex=self.ttl)
+        pipe.zadd(self.lru_key, {entry: time.time()})
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = [k for k, _ in self.r.zpopmin(self.lru_key, overflow)]
+            if evicted:
+                self.r.delete(*evicted)
+
+    def stats(self) -> dict:
+        """
+        Returns {stage: {"hits": n, "misses": n}}.
+        """
+        out = {}
+        for field, count in self.r.hgetall(self.stats_key).items():
+            stage, kind = field.rsplit(":", 1)
+            out.setdefault(stage, {"hits": 0, "misses": 0})[kind] = int(count)
+        return out
@@ -0,0 +1,97 @@
+# flask_app/status_api.py
+import hashlib
+import json
+import os
+import re
+
+# job ids accepted by one /job-status request
+JOB_STATUS_MAX_IDS = int(os.environ.get("JOB_STATUS_MAX_IDS", 200))
+# multi-job responses leave these out unless asked for with ?fields=
+MULTI_STATUS_EXCLUDE = ("metrics",)
+UNKNOWN_STATUS = '{"status":"unknown"}'
+
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def status_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def encode(data) -> str:
+    """
+    JSON without the default separators' spaces; status records are stored
+    and served in this form.
+    """
+    return json.dumps(data, separators=(",", ":"))
+
+
+def parse_ids(values) -> list:
+    """
+    Job ids from ?job_ids=a,b (repeatable) or a JSON list, deduplicated in
+    order. Raises ValueError for malformed ids or too many of them.
+    """
+    ids = []
+    for value in values:
+        parts = value.split(",") if isinstance(value, str) else [value]
+        for job_id in parts:
+            if not isinstance(job_id, str) or not _JOB_ID_RE.match(job_id.strip()):
+                raise ValueError(f"invalid job id {job_id!r}")
+            ids.append(job_id.strip())
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > JOB_STATUS_MAX_IDS:
+        raise ValueError(f"at most {JOB_STATUS_MAX_IDS} job ids per request")
+    return ids
+
+
+def parse_fields(value):
+    if not value:
+        return None
+    return tuple(f.strip() for f in value.split(",") if f.strip())
+
+
+def project(raw, fields=None, exclude=()) -> str:
+    """
+    A stored status record reduced to `fields` (or without `exclude`).
+    Returned as stored when nothing is to be dropped.
+    """
+    if raw is None:
+        return UNKNOWN_STATUS
+    if not fields and not exclude:
+        return raw
+    data = json.loads(raw)
+    if fields:
+        return encode({k: v for k, v in data.items() if k in fields})
+    return encode({k: v for k, v in data.items() if k not in exclude})
+
+
+def multi_status_body(job_ids, records, fields=None) -> str:
+    """
+    {"jobs": {job_id: record}} built from the MGET result, in request order.
+    """
+    exclude = () if fields else MULTI_STATUS_EXCLUDE
+    parts = (
+        f"{json.dumps(job_id)}:{project(raw, fields, exclude)}"
+        for job_id, raw in zip(job_ids, records)
+    )
+    return '{"jobs":{' + ",".join(parts) + "}}"
+
+
+def etag(body: str) -> str:
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match, tag: str) -> bool:
+    """
+    True when an If-None-Match header names `tag` (weak or strong) or "*".
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == tag:
+            return True
+    return False
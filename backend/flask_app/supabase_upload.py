@@ -1,9 +1,14 @@
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from supabase import create_client, Client
+from storage3.utils import StorageException
 from dotenv import load_dotenv
-from uuid import uuid4
 import cloudinary
 import cloudinary.uploader
+import crew_wrapper  # noqa: F401  (puts resume_tailor on sys.path)
+from resume_tailor.instrumentation import timed
 
 load_dotenv()
 cloudinary.config(
@@ -15,56 +20,163 @@ cloudinary.config(
 
 SUPABASE_BUCKET = "resumes"
 SIGNED_URL_EXPIRY = 3600
+# hand out cached signed URLs only while they have this much life left
+SIGNED_URL_REFRESH_MARGIN = 300
+# how long we trust that a content-addressed object still exists remotely
+ARTIFACT_MEMO_TTL = 60 * 60 * 24 * 30
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Supabase environment variables not set")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# created lazily per process: the client keeps pooled HTTP connections,
+# which must not be inherited across a Celery prefork
+_supabase: Optional[Client] = None
 
 
-def upload_tex_to_supabase(file_path: str, folder: str) -> str:
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(file_path)
+def get_supabase() -> Client:
+    global _supabase
+    if _supabase is None:
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+
+# tex and pdf go to different services, so upload them side by side
+_upload_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload")
+
+
+def init_clients() -> None:
+    """
+    Opens the upload clients up front (called from the worker init hook).
+    """
+    get_supabase()
 
-    ext = os.path.splitext(file_path)[1]
-    filename = f"{folder}/{uuid4()}{ext}"
 
+def file_digest(file_path: str) -> str:
+    h = hashlib.sha256()
     with open(file_path, "rb") as f:
-        data = f.read()
-
-    # Upload TEX
-    supabase.storage.from_(SUPABASE_BUCKET).upload(
-        path=filename,
-        file=data,
-        file_options={
-            "contentType": "text/plain",
-            "cacheControl": "3600",
-            "upsert": "false",
-        },
-    )
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_duplicate(error: StorageException) -> bool:
+    text = str(error)
+    return "Duplicate" in text or "already exists" in text or "409" in text
+
 
-    # Generate signed URL
-    signed = supabase.storage.from_(SUPABASE_BUCKET).create_signed_url(
-        path=filename,
-        expires_in=SIGNED_URL_EXPIRY,
+def sign_tex_url(storage_path: str, r=None) -> str:
+    """
+    Signed URL for a stored object, reused from Redis until it is close
+    to expiring.
+    """
+    cache_key = f"signed:{storage_path}"
+    if r is not None:
+        cached = r.get(cache_key)
+        if cached:
+            return cached
+
+    signed = (
+        get_supabase()
+        .storage.from_(SUPABASE_BUCKET)
+        .create_signed_url(
+            path=storage_path,
+            expires_in=SIGNED_URL_EXPIRY,
+        )
     )
+    url = signed["signedURL"]
+
+    if r is not None:
+        r.set(cache_key, url, ex=SIGNED_URL_EXPIRY - SIGNED_URL_REFRESH_MARGIN)
+    return url
+
 
-    return signed["signedURL"]
+def tex_object_path(file_path: str, folder: str = "latex") -> str:
+    """
+    Content-addressed storage path: identical output maps to the same object.
+    """
+    ext = os.path.splitext(file_path)[1]
+    return f"{folder}/{file_digest(file_path)}{ext}"
 
 
-def upload_pdf_to_cloudinary(file_path: str, folder: str) -> str:
+def upload_tex_to_supabase(file_path: str, folder: str, r=None) -> str:
     if not os.path.exists(file_path):
         raise FileNotFoundError(file_path)
 
-    result = cloudinary.uploader.upload(
-        file_path,
-        resource_type="raw",  # IMPORTANT for PDFs
-        folder=folder,
-        use_filename=True,
-        unique_filename=True,
-    )
+    filename = tex_object_path(file_path, folder)
+    memo = f"artifact:supabase:{filename}"
+
+    if r is None or not r.exists(memo):
+        # Upload TEX, streamed from disk
+        with timed("upload", "supabase"), open(file_path, "rb") as f:
+            try:
+                get_supabase().storage.from_(SUPABASE_BUCKET).upload(
+                    path=filename,
+                    file=f,
+                    file_options={
+                        "contentType": "text/plain",
+                        "cacheControl": "3600",
+                        "upsert": "false",
+                    },
+                )
+            except StorageException as e:
+                if not _is_duplicate(e):
+                    raise
+        if r is not None:
+            r.set(memo, 1, ex=ARTIFACT_MEMO_TTL)
+
+    return sign_tex_url(filename, r)
+
+
+def upload_pdf_to_cloudinary(file_path: str, folder: str, r=None) -> str:
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+
+    public_id = f"{file_digest(file_path)}.pdf"
+    memo = f"artifact:cloudinary:{folder}/{public_id}"
+    if r is not None:
+        cached = r.get(memo)
+        if cached:
+            return cached
+
+    with timed("upload", "cloudinary"):
+        result = cloudinary.uploader.upload(
+            file_path,
+            resource_type="raw",  # IMPORTANT for PDFs
+            folder=folder,
+            public_id=public_id,
+            unique_filename=False,
+            overwrite=False,
+        )
 
     # Cloudinary always returns a valid HTTPS URL
-    return result["secure_url"]
+    url = result["secure_url"]
+    if r is not None:
+        r.set(memo, url, ex=ARTIFACT_MEMO_TTL)
+    return url
+
+
+def upload_artifacts(tex_path: str, pdf_path: str, r=None) -> dict:
+    """
+    Uploads the .tex and .pdf concurrently. Objects are named by content
+    hash, and with a Redis client outputs seen before skip the upload.
+    """
+    tex = _upload_pool.submit(upload_tex_to_supabase, tex_path, "latex", r)
+    pdf = _upload_pool.submit(upload_pdf_to_cloudinary, pdf_path, "pdf", r)
+    return {"tex_url": tex.result(), "pdf_url": pdf.result()}
+
+
+def upload_artifact_group(pairs, r=None) -> list:
+    """
+    Uploads many (tex_path, pdf_path) pairs at once through the shared pool
+    and returns their URL dicts in the same order.
+    """
+    futures = [
+        (
+            _upload_pool.submit(upload_tex_to_supabase, tex_path, "latex", r),
+            _upload_pool.submit(upload_pdf_to_cloudinary, pdf_path, "pdf", r),
+        )
+        for tex_path, pdf_path in pairs
+    ]
+    return [{"tex_url": tex.result(), "pdf_url": pdf.result()} for tex, pdf in futures]
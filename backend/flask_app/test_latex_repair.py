@@ -0,0 +1,26 @@
+# flask_app/test_latex_repair.py
+from latex_repair import escape_text_percents
+
+
+def test_escapes_percent_of_a_number_in_text():
+    line = r"Cut costs by 50% across 3.5% of \textbf{teams}"
+    assert escape_text_percents(line) == (
+        r"Cut costs by 50\% across 3.5\% of \textbf{teams}"
+    )
+
+
+def test_keeps_comments():
+    for line in [
+        "% 50% of the bullets were rewritten",
+        "Cut costs by 50 % rewritten",
+        "Cut costs by 50%% rewritten",
+        r"\penalty10000%",
+        r"\setlength{\tabcolsep}{0pt}% tighter columns",
+        r"Cut costs by 50\% % rewritten",
+    ]:
+        assert escape_text_percents(line) == line
+
+
+def test_stops_at_the_first_comment():
+    line = "Cut costs by 50% % 20% in the draft"
+    assert escape_text_percents(line) == r"Cut costs by 50\% % 20% in the draft"
@@ -0,0 +1,42 @@
+# flask_app/workspace.py
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+def _default_root() -> str:
+    # Prefer tmpfs so pdflatex aux/log churn never touches the disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return os.path.join("/dev/shm", "resume_tailor")
+    return os.path.join(tempfile.gettempdir(), "resume_tailor")
+
+
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT") or _default_root()
+
+
+def workspace_path(job_id: str) -> str:
+    """
+    Returns the workspace directory for a job (not created).
+    """
+    return os.path.join(WORKSPACE_ROOT, f"job-{job_id}")
+
+
+@contextmanager
+def job_workspace(job_id: str, keep_on_error: bool = False):
+    """
+    Creates an isolated directory for a single job's .tex, .pdf and aux
+    files and removes it once the job is done.
+    With `keep_on_error`, a failed attempt leaves the directory in place so
+    a retry of the same job can reuse what was already produced.
+    """
+    path = workspace_path(job_id)
+    os.makedirs(path, exist_ok=True)
+    try:
+        yield path
+    except BaseException:
+        if not keep_on_error:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    else:
+        shutil.rmtree(path, ignore_errors=True)
@@ -1,30 +1,185 @@
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai.agents.agent_builder.base_agent import BaseAgent
-from typing import List
-from crewai.llm import LLM
+from crewai.tasks.task_output import TaskOutput
+from typing import Dict, List
+from functools import lru_cache
+import hashlib
+import json
 import os
+import yaml
 from dotenv import load_dotenv
-from crewai_tools import PDFSearchTool
 from resume_tailor.tools.pdf_search_tool import DynamicPDFTool
+from resume_tailor.schema import TailoredResume
+from resume_tailor.instrumentation import InstrumentedLLM
+from resume_tailor.latex_renderer import RENDERER_VERSION
+from resume_tailor.prompt_compaction import COMPACTION_VERSION, compact_task_output
+from resume_tailor.routing import stage_policy
 
 # pdftool = PDFSearchTool(pdf=r"E:\Resume-Project\ResumeTailor\Roshan's-Resume.pdf")
 load_dotenv()
 
+TEX_FILE_NAME = "tailored_resume.tex"
+# {output_dir} is interpolated from the kickoff inputs so every job writes
+# into its own workspace instead of the process CWD
+TEX_OUTPUT_FILE = "{output_dir}/" + TEX_FILE_NAME
 
-llm1 = LLM(
+# jd_task and resume_task share no context, so they can run side by side and
+# be joined by writer_task. Set RESUME_TAILOR_PARALLEL=0 to run them in order.
+PARALLEL_ANALYSIS = os.environ.get("RESUME_TAILOR_PARALLEL", "1") == "1"
+
+# "template": writer_task emits a TailoredResume that latex_renderer turns
+# into LaTeX locally. "llm": the latex/alignment agents write the .tex.
+LATEX_MODE = os.environ.get("RESUME_TAILOR_LATEX_MODE", "template")
+LLM_LATEX_STAGES = ("latex_task", "final_alignment_task")
+# the one-page fitting loop replaces the alignment LLM pass unless asked for
+LLM_ALIGNMENT = os.environ.get("RESUME_TAILOR_LLM_ALIGNMENT", "0") == "1"
+# stream the LaTeX stages' answers (validated and written to the .tex as
+# they arrive, see streaming.py); RESUME_TAILOR_STREAM_LATEX=0 turns it off
+STREAM_LATEX = os.environ.get("RESUME_TAILOR_STREAM_LATEX", "1") == "1"
+# agent/crew step logging; timings and tokens are recorded by instrumentation
+VERBOSE = os.environ.get("RESUME_TAILOR_VERBOSE", "0") == "1"
+
+
+llm1 = InstrumentedLLM(
+    model="openai/gpt-4o",
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    temperature=0.5,
+    max_tokens=12000,
+)
+llm = InstrumentedLLM(
+    model="openai/gpt-4o-mini",
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    temperature=0.7,
+    max_tokens=8000,
+)
+# same settings as llm1 / llm, streamed for the LaTeX agents
+latex_llm = InstrumentedLLM(
     model="openai/gpt-4o",
     api_key=os.environ.get("OPENAI_API_KEY"),
     temperature=0.5,
     max_tokens=12000,
+    stream=STREAM_LATEX,
 )
-llm = LLM(
+alignment_llm = InstrumentedLLM(
     model="openai/gpt-4o-mini",
     api_key=os.environ.get("OPENAI_API_KEY"),
     temperature=0.7,
     max_tokens=8000,
+    stream=STREAM_LATEX,
+)
+# fixes the few LaTeX lines pdflatex rejected; called outside the crew
+repair_llm = InstrumentedLLM(
+    model=os.environ.get("LATEX_REPAIR_MODEL", "openai/gpt-4o-mini"),
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    temperature=0,
+    max_tokens=1500,
 )
 
+# which LLM each agent calls through; the routing policy (routing.py) picks
+# the model, temperature and max_tokens of each call for the stages it lists
+AGENT_LLMS = {
+    "jd_agent": llm,
+    "resume_agent": llm,
+    "writer_agent": llm1,
+    "latex_agent": latex_llm,
+    "final_alignment_agent": alignment_llm,
+}
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "config")
+
+
+@lru_cache(maxsize=None)
+def _raw_config(file_name: str) -> dict:
+    with open(os.path.join(CONFIG_DIR, file_name), encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def stage_fingerprint(task_name: str) -> str:
+    """
+    Hash of everything besides the inputs that shapes a task's output:
+    its task and agent prompts, the model settings and routing rules it
+    runs with and the compaction rules applied to its input and output.
+    """
+    task_config = _raw_config("tasks.yaml")[task_name]
+    agent_name = task_config["agent"]
+    model = AGENT_LLMS[agent_name]
+    blob = json.dumps(
+        {
+            "task": task_config,
+            "agent": _raw_config("agents.yaml")[agent_name],
+            "model": model.model,
+            "temperature": model.temperature,
+            "max_tokens": model.max_tokens,
+            "routing": stage_policy(task_name),
+            "compaction": COMPACTION_VERSION,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def active_stages(task_names: List[str]) -> List[str]:
+    """
+    The tasks the crew runs in the configured LaTeX mode, in order.
+    """
+    if LATEX_MODE == "template":
+        return [n for n in task_names if n not in LLM_LATEX_STAGES]
+    if not LLM_ALIGNMENT:
+        return [n for n in task_names if n != "final_alignment_task"]
+    return list(task_names)
+
+
+@lru_cache(maxsize=None)
+def pipeline_fingerprint() -> str:
+    """
+    Hash of everything besides the inputs that shapes a finished resume:
+    the fingerprints of every stage that runs, the LaTeX mode and the
+    template renderer's version.
+    """
+    stages = active_stages(list(_raw_config("tasks.yaml")))
+    blob = json.dumps(
+        {
+            "stages": {name: stage_fingerprint(name) for name in stages},
+            "latex_mode": LATEX_MODE,
+            "renderer": RENDERER_VERSION if LATEX_MODE == "template" else None,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def task_output_text(output: TaskOutput) -> str:
+    """
+    Serializable form of a task's output: the validated model as JSON for
+    structured tasks, the raw text otherwise.
+    """
+    if output.pydantic is not None:
+        return output.pydantic.model_dump_json()
+    return output.raw
+
+
+def prefill_stages(crew: Crew, stage_outputs: Dict[str, str]) -> Crew:
+    """
+    Marks the tasks named in `stage_outputs` as already done and drops them
+    from the crew, so kickoff skips their LLM calls. Downstream tasks still
+    see the outputs through their `context`.
+    """
+    pending = []
+    for t in crew.tasks:
+        raw = stage_outputs.get(t.name)
+        if raw is None:
+            pending.append(t)
+            continue
+        t.output = TaskOutput(
+            name=t.name,
+            description=t.description,
+            agent=t.agent.role if t.agent else "",
+            raw=raw,
+        )
+    crew.tasks = pending
+    return crew
+
 
 @CrewBase
 class ResumeTailor:
@@ -38,8 +193,8 @@ class ResumeTailor:
     def jd_agent(self) -> Agent:
         return Agent(
             config=self.agents_config["jd_agent"],  # loaded from agents.yaml
-            verbose=True,
-            llm=llm,
+            verbose=VERBOSE,
+            llm=AGENT_LLMS["jd_agent"],
         )
 
     @agent
@@ -47,58 +202,85 @@ class ResumeTailor:
         return Agent(
             config=self.agents_config["resume_agent"],
             tools=[DynamicPDFTool()],
-            verbose=True,
-            llm=llm,
+            verbose=VERBOSE,
+            llm=AGENT_LLMS["resume_agent"],
         )
 
     @agent
     def writer_agent(self) -> Agent:
-        return Agent(config=self.agents_config["writer_agent"], llm=llm1, verbose=True)
+        return Agent(
+            config=self.agents_config["writer_agent"],
+            llm=AGENT_LLMS["writer_agent"],
+            verbose=VERBOSE,
+        )
 
     @agent
     def latex_agent(self) -> Agent:
-        return Agent(config=self.agents_config["latex_agent"], llm=llm1, verbose=True)
+        return Agent(
+            config=self.agents_config["latex_agent"],
+            llm=AGENT_LLMS["latex_agent"],
+            verbose=VERBOSE,
+        )
 
     @agent
     def final_alignment_agent(self) -> Agent:
         return Agent(
-            config=self.agents_config["final_alignment_agent"], llm=llm, verbose=True
+            config=self.agents_config["final_alignment_agent"],
+            llm=AGENT_LLMS["final_alignment_agent"],
+            verbose=VERBOSE,
         )
 
     # ---------------- TASKS ----------------
+    # the analysis tasks' outputs are compacted to what writer_task reads
+    # before they are handed on as context
     @task
     def jd_task(self) -> Task:
-        return Task(config=self.tasks_config["jd_task"])
+        return Task(
+            config=self.tasks_config["jd_task"],
+            async_execution=PARALLEL_ANALYSIS,
+            callback=compact_task_output,
+        )
 
     @task
     def resume_task(self) -> Task:
-        return Task(config=self.tasks_config["resume_task"])
+        return Task(
+            config=self.tasks_config["resume_task"],
+            async_execution=PARALLEL_ANALYSIS,
+            callback=compact_task_output,
+        )
 
     @task
     def writer_task(self) -> Task:
-        return Task(config=self.tasks_config["writer_task"])
+        # context (jd_task, resume_task) comes from tasks.yaml; the crew waits
+        # for both async tasks before starting this one
+        return Task(
+            config=self.tasks_config["writer_task"],
+            output_pydantic=TailoredResume,
+        )
 
     @task
     def latex_task(self) -> Task:
         return Task(
             config=self.tasks_config["latex_task"],
-            output_file="tailored_resume.tex",  # so LaTeX file is saved automatically
+            output_file=TEX_OUTPUT_FILE,  # so LaTeX file is saved automatically
         )
 
     @task
     def final_alignment_task(self) -> Task:
         return Task(
             config=self.tasks_config["final_alignment_task"],
-            output_file="tailored_resume.tex",
+            output_file=TEX_OUTPUT_FILE,
         )
 
     # ---------------- CREW ----------------
     @crew
     def crew(self) -> Crew:
         """Creates the ResumeTailor crew"""
+        names = active_stages([t.name for t in self.tasks])  # Auto-created by @task
+        tasks = [t for t in self.tasks if t.name in names]
         return Crew(
-            agents=self.agents,  # Auto-created by @agent
-            tasks=self.tasks,  # Auto-created by @task
+            agents=[a for a in self.agents if any(t.agent is a for t in tasks)],
+            tasks=tasks,
             process=Process.sequential,
-            verbose=True,
+            verbose=VERBOSE,
         )
@@ -0,0 +1,235 @@
+"""
+Resume PDF downloads: streamed to disk in chunks with a size cap, over a
+pooled session, and kept in an on-disk LRU cache that is revalidated with
+conditional GETs (ETag / Last-Modified).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resume_tailor.instrumentation import timed
+
+DOWNLOAD_CACHE_DIR = os.environ.get(
+    "RESUME_DOWNLOAD_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "resume_tailor", "downloads"),
+)
+DOWNLOAD_CACHE_MAX_BYTES = int(
+    os.environ.get("RESUME_DOWNLOAD_CACHE_MAX_BYTES", 500 * 1024 * 1024)
+)
+# entries validated this recently are served without asking the server
+DOWNLOAD_FRESH_SECONDS = int(os.environ.get("RESUME_DOWNLOAD_FRESH_SECONDS", 300))
+RESUME_MAX_BYTES = int(os.environ.get("RESUME_MAX_BYTES", 10 * 1024 * 1024))
+DOWNLOAD_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+# storage buckets often serve PDFs as octet-stream; the %PDF magic is checked too
+PDF_CONTENT_TYPES = (
+    "application/pdf",
+    "application/octet-stream",
+    "binary/octet-stream",
+)
+
+# query parameters that only sign a URL (Supabase's token, S3/GCS/CloudFront
+# presigning); every other parameter can select a different file
+SIGNING_PARAMS = frozenset({"token", "signature", "expires", "key-pair-id", "policy"})
+SIGNING_PARAM_PREFIXES = ("x-amz-", "x-goog-")
+
+_session = None
+_session_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+def is_url(path: str) -> bool:
+    return path.startswith("http://") or path.startswith("https://")
+
+
+def session() -> requests.Session:
+    """
+    Process-wide session, so repeat downloads reuse pooled connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _signing_param(name: str) -> bool:
+    name = name.lower()
+    return name in SIGNING_PARAMS or name.startswith(SIGNING_PARAM_PREFIXES)
+
+
+def cache_key(url: str) -> str:
+    """
+    Keyed on the whole URL except its signing parameters: signed URLs
+    (Supabase) carry a fresh token on every signing, while any other query
+    parameter (?id= on a download endpoint) may name another file. Every
+    reuse after the fresh window is revalidated against the server, which
+    catches changed content.
+    """
+    parts = urlsplit(url)
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not _signing_param(k)
+    )
+    key = f"{parts.netloc}{parts.path}?{urlencode(query)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DownloadCache:
+    """
+    `<key>.pdf` plus `<key>.json` (url, validators, last check) per entry.
+    Hits bump the file's mtime; past `max_bytes` the oldest are removed.
+    """
+
+    def __init__(
+        self, directory: str = DOWNLOAD_CACHE_DIR, max_bytes=DOWNLOAD_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + ".pdf", base + ".json"
+
+    def lookup(self, key: str):
+        pdf_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if not os.path.exists(pdf_path):
+            return None, None
+        return pdf_path, meta
+
+    def touch(self, key: str, meta: dict) -> None:
+        pdf_path, meta_path = self._paths(key)
+        meta["checked"] = time.time()
+        self._write_meta(meta_path, meta)
+        os.utime(pdf_path)
+
+    def store(self, key: str, tmp_path: str, meta: dict) -> str:
+        pdf_path, meta_path = self._paths(key)
+        meta["checked"] = time.time()
+        # pdf first, then meta: a reader never sees validators for old bytes
+        os.replace(tmp_path, pdf_path)
+        self._write_meta(meta_path, meta)
+        self.evict()
+        return pdf_path
+
+    def _write_meta(self, meta_path: str, meta: dict) -> None:
+        tmp = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def evict(self) -> None:
+        with _cache_lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".pdf"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name[: -len(".pdf")]))
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+def _stream_to(response, path: str, max_bytes: int) -> int:
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise DownloadError(f"PDF is larger than {max_bytes} bytes")
+            if chunk and size == len(chunk) and not chunk.startswith(b"%PDF-"):
+                raise DownloadError("response is not a PDF")
+            f.write(chunk)
+    return size
+
+
+def fetch_pdf(url: str, max_bytes: int = RESUME_MAX_BYTES, cache=None) -> str:
+    """
+    Local path of the PDF at `url`, from the download cache when the server
+    confirms it is unchanged. The path belongs to the cache: copy it before
+    keeping it beyond the current job.
+    """
+    cache = cache or DownloadCache()
+    os.makedirs(cache.directory, exist_ok=True)
+    key = cache_key(url)
+
+    with timed("download", urlsplit(url).netloc) as span:
+        cached_path, meta = cache.lookup(key)
+        headers = {}
+        if cached_path is not None:
+            if time.time() - meta.get("checked", 0) < DOWNLOAD_FRESH_SECONDS:
+                cache.touch(key, meta)
+                span["cache"] = "hit"
+                return cached_path
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with session().get(
+            url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+        ) as response:
+            if response.status_code == 304 and cached_path is not None:
+                cache.touch(key, meta)
+                span["cache"] = "revalidated"
+                return cached_path
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "")
+            content_type = content_type.split(";")[0].strip().lower()
+            if content_type and content_type not in PDF_CONTENT_TYPES:
+                raise DownloadError(f"unexpected content type {content_type!r}")
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise DownloadError(f"PDF is larger than {max_bytes} bytes")
+
+            tmp_path = os.path.join(cache.directory, f"{key}.{uuid.uuid4().hex}.tmp")
+            try:
+                span["bytes"] = _stream_to(response, tmp_path, max_bytes)
+                path = cache.store(
+                    key,
+                    tmp_path,
+                    {
+                        # without the query string: it may hold a signing token
+                        "url": url.split("?", 1)[0],
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    },
+                )
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        span["cache"] = "miss"
+        return path
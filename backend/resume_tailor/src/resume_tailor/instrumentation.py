@@ -0,0 +1,366 @@
+"""
+Lightweight per-job instrumentation.
+
+Every crew task, LLM call, tool call, pdflatex run and upload is recorded as
+a span (kind, name, wall time, tokens, model) on the active Recorder, which
+the worker attaches to the job record and folds into the metrics histograms.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+import litellm
+from crewai.events.types.llm_events import LLMCallType
+from crewai.llm import LLM
+from litellm.integrations.custom_logger import CustomLogger
+from resume_tailor.routing import current_route, route, routed
+from resume_tailor.scheduling import (
+    LLMScheduler,
+    current_priority,
+    estimate_tokens,
+    get_scheduler,
+    rate_limit_delay,
+)
+from resume_tailor.streaming import (
+    STREAM_ABORT_RETRIES,
+    StreamAborted,
+    retry_messages,
+    watcher_for,
+)
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens")
+# estimated prompt tokens removed by prompt_compaction, on its spans
+SAVED_FIELD = "saved_tokens"
+
+_current = contextvars.ContextVar("resume_tailor_recorder", default=None)
+# async crew tasks and the upload pool run on threads that don't inherit
+# contextvars; a worker process runs one job at a time, so spans recorded
+# there fall back to the process-wide recorder
+_process_recorder = None
+
+
+class Recorder:
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, name: str, seconds: float, **fields) -> dict:
+        span = {"kind": kind, "name": name, "seconds": round(seconds, 4), **fields}
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def tokens(self, **match) -> dict:
+        """
+        Token totals over the LLM spans whose fields equal `match`.
+        """
+        totals = dict.fromkeys(TOKEN_FIELDS, 0)
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span["kind"] != "llm":
+                continue
+            if any(span.get(k) != v for k, v in match.items()):
+                continue
+            for field in TOKEN_FIELDS:
+                totals[field] += span.get(field) or 0
+        return totals
+
+    def model_of(self, task_id: str) -> Optional[str]:
+        """
+        The model of the task's last LLM call, as routed.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        for span in reversed(spans):
+            if span["kind"] == "llm" and span.get("task_id") == task_id:
+                return span.get("model")
+        return None
+
+    def summary(self) -> dict:
+        """
+        Spans plus per-kind totals, small enough to store on the job record.
+        """
+        by_kind = {}
+        saved = 0
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            kind = by_kind.setdefault(
+                span["kind"],
+                {"count": 0, "seconds": 0.0, **dict.fromkeys(TOKEN_FIELDS, 0)},
+            )
+            kind["count"] += 1
+            kind["seconds"] = round(kind["seconds"] + span["seconds"], 4)
+            for field in TOKEN_FIELDS:
+                kind[field] += span.get(field) or 0
+            saved += span.get(SAVED_FIELD) or 0
+        return {"totals": by_kind, SAVED_FIELD: saved, "spans": spans}
+
+
+def current() -> Optional[Recorder]:
+    return _current.get() or _process_recorder
+
+
+def record(kind: str, name: str, seconds: float, **fields) -> None:
+    recorder = current()
+    if recorder is not None:
+        recorder.add(kind, name, seconds, **fields)
+
+
+@contextmanager
+def timed(kind: str, name: str, **fields):
+    """
+    Records the wall time of the block. The yielded dict can be filled with
+    extra fields (tokens, cache hits) before the block ends.
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(kind, name, time.perf_counter() - start, **fields)
+
+
+@contextmanager
+def recording():
+    """
+    Makes a fresh Recorder the active one for the duration of a job.
+    """
+    global _process_recorder
+    recorder = Recorder()
+    token = _current.set(recorder)
+    previous, _process_recorder = _process_recorder, recorder
+    try:
+        yield recorder
+    finally:
+        _process_recorder = previous
+        _current.reset(token)
+
+
+def record_task(task) -> None:
+    """
+    Span for a finished crew task, with the tokens of the LLM calls it made.
+    """
+    recorder = current()
+    if recorder is None or task.execution_duration is None:
+        return
+    model = recorder.model_of(str(task.id)) or getattr(
+        getattr(task.agent, "llm", None), "model", None
+    )
+    recorder.add(
+        "task",
+        task.name,
+        task.execution_duration,
+        model=model,
+        **recorder.tokens(task_id=str(task.id)),
+    )
+
+
+class _UsageCapture(CustomLogger):
+    """
+    Receives the usage block of the completion crewai just made. litellm
+    also reports every completion to the registered callbacks from its own
+    logging threads, which with concurrent crews may be another call's
+    usage, so only reports made on the calling thread are kept.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.usage = None
+        self.thread = threading.get_ident()
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        if threading.get_ident() != self.thread:
+            return
+        usage = response_obj.get("usage") if isinstance(response_obj, dict) else None
+        if usage:
+            self.usage = usage
+
+
+def _usage_tokens(usage, field: str) -> int:
+    if isinstance(usage, dict):
+        return usage.get(field) or 0
+    return getattr(usage, field, None) or 0
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    """
+    Estimated USD cost from litellm's price table; None for models it
+    does not price.
+    """
+    try:
+        prompt, completion = litellm.cost_per_token(
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+    except Exception:
+        return None
+    return round(prompt + completion, 6)
+
+
+def _chunk_text(chunk) -> Optional[str]:
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    delta = getattr(choices[0], "delta", None)
+    return getattr(delta, "content", None)
+
+
+class InstrumentedLLM(LLM):
+    """
+    LLM that records wall time, tokens, cost and model for every call, and
+    goes through the installed LLMScheduler: it waits for rate-limit
+    capacity first and retries calls the provider rate-limited. Calls made
+    for a task are routed first (see routing.py): the policy may put them
+    on another model and size their max_tokens. With stream=True,
+    calls made for a task being watched (see streaming.watching) are read
+    through a LatexStreamWatcher, and re-asked once when it aborts them.
+    """
+
+    def call(
+        self,
+        messages,
+        tools=None,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+    ):
+        scheduler = get_scheduler() or LLMScheduler()
+        attempt = 0
+        aborted = 0
+        while True:
+            choice = route(from_task, messages)
+            model = choice.model if choice else self.model
+            max_tokens = choice.max_tokens if choice else self.max_tokens
+            # providers count max_tokens against the limit up front
+            reserved = estimate_tokens(messages) + (max_tokens or 0)
+            with timed("llm_wait", model):
+                scheduler.acquire(model, reserved, current_priority())
+            capture = _UsageCapture()
+            try:
+                with timed(
+                    "llm",
+                    model,
+                    model=model,
+                    task=getattr(from_task, "name", None),
+                    task_id=str(from_task.id) if from_task is not None else None,
+                    **(choice.span_fields() if choice else {}),
+                ) as span, routed(choice):
+                    try:
+                        return super().call(
+                            messages,
+                            tools=tools,
+                            callbacks=[*(callbacks or []), capture],
+                            available_functions=available_functions,
+                            from_task=from_task,
+                            from_agent=from_agent,
+                        )
+                    finally:
+                        for field in TOKEN_FIELDS:
+                            span[field] = _usage_tokens(capture.usage, field)
+                        span["cost_usd"] = call_cost(
+                            model, span["prompt_tokens"], span["completion_tokens"]
+                        )
+            except StreamAborted as e:
+                record(
+                    "stream_abort",
+                    model,
+                    0.0,
+                    task=getattr(from_task, "name", None),
+                    reason=str(e),
+                )
+                if aborted >= STREAM_ABORT_RETRIES:
+                    raise
+                messages = retry_messages(messages, e)
+                aborted += 1
+            except Exception as e:
+                retry_after = rate_limit_delay(e)
+                if retry_after is None or attempt >= scheduler.max_retries:
+                    raise
+                scheduler.backoff(model, retry_after or None, attempt)
+                attempt += 1
+            finally:
+                used = sum(_usage_tokens(capture.usage, f) for f in TOKEN_FIELDS)
+                if used > reserved:
+                    scheduler.settle(model, used - reserved)
+
+    def _prepare_completion_params(self, messages, tools=None):
+        """
+        The completion parameters, with the active route's model,
+        temperature and max_tokens in place of this LLM's own.
+        """
+        params = super()._prepare_completion_params(messages, tools)
+        choice = current_route()
+        if choice is not None:
+            params["model"] = choice.model
+            params["max_tokens"] = choice.max_tokens
+            if choice.temperature is not None:
+                params["temperature"] = choice.temperature
+        return params
+
+    def _handle_streaming_response(
+        self,
+        params,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+    ):
+        """
+        Feeds the stream to the task's watcher and stops reading as soon
+        as the document is complete; unwatched calls stream as usual.
+        """
+        watcher = watcher_for(from_task)
+        if watcher is None:
+            return super()._handle_streaming_response(
+                params, callbacks, available_functions, from_task, from_agent
+            )
+
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
+        start = datetime.now()
+        usage = None
+        stream = litellm.completion(**params)
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                text = _chunk_text(chunk)
+                if text and watcher.feed(text):
+                    break
+        finally:
+            watcher.close()
+            # stop the provider generating tokens nobody reads
+            close = getattr(getattr(stream, "completion_stream", None), "close", None)
+            if close is not None:
+                close()
+
+        if not watcher.complete and not watcher.text.strip():
+            raise StreamAborted("empty response")
+        if usage is None:
+            # no usage block arrives when the stream is cut short
+            usage = {
+                "prompt_tokens": estimate_tokens(params["messages"]),
+                "completion_tokens": estimate_tokens(watcher.text),
+            }
+        for callback in callbacks or []:
+            if hasattr(callback, "log_success_event"):
+                callback.log_success_event(
+                    kwargs=params,
+                    response_obj={"usage": usage},
+                    start_time=start,
+                    end_time=datetime.now(),
+                )
+        self._handle_emit_call_events(
+            response=watcher.text,
+            call_type=LLMCallType.LLM_CALL,
+            from_task=from_task,
+            from_agent=from_agent,
+            messages=params["messages"],
+        )
+        return watcher.text
@@ -0,0 +1,257 @@
+"""
+Deterministic LaTeX rendering of a TailoredResume.
+
+Replaces the latex_agent LLM stage: the same structured resume always
+renders to the same .tex, so the output is reproducible and cacheable.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+from resume_tailor.schema import TailoredResume
+
+# bump when the template changes so cached renders are invalidated
+RENDERER_VERSION = "2"
+
+PREAMBLE = r"""\documentclass[11pt,a4paper]{article}
+\usepackage[T1]{fontenc}
+\usepackage[utf8]{inputenc}
+\usepackage{lmodern}
+\usepackage{textcomp}
+\usepackage[margin=0.5in]{geometry}
+\usepackage{enumitem}
+\usepackage{titlesec}
+\usepackage{xcolor}
+\usepackage[hidelinks]{hyperref}
+
+\pagestyle{empty}
+\setlength{\parindent}{0pt}
+\titleformat{\section}{\large\bfseries\scshape}{}{0em}{}[\titlerule]
+\titlespacing*{\section}{0pt}{8pt}{4pt}
+\setlist[itemize]{leftmargin=1.2em, itemsep=1pt, topsep=2pt, parsep=0pt}
+
+\newcommand{\resumetitle}[2]{\textbf{#1}\hfill\textbf{#2}\par}
+\newcommand{\resumeentry}[4]{%
+  \resumetitle{#1}{#4}
+  \textit{#2}\hfill\textit{#3}\par}
+"""
+
+
+@dataclass(frozen=True)
+class Layout:
+    """Layout knobs the one-page fitting loop turns; defaults match PREAMBLE."""
+
+    margin_in: float = 0.5
+    font_size_pt: float = 11
+    itemsep_pt: float = 1
+    section_before_pt: float = 8
+    section_after_pt: float = 4
+
+    def commands(self, preamble: str) -> List[str]:
+        """
+        Body-level overrides for this layout, limited to the packages the
+        document's preamble actually loads.
+        """
+        out = [
+            rf"\fontsize{{{self.font_size_pt:g}pt}}{{{self.font_size_pt * 1.2:g}pt}}\selectfont"
+        ]
+        if _loads_package(preamble, "geometry"):
+            out.append(rf"\newgeometry{{margin={self.margin_in:g}in}}")
+        if _loads_package(preamble, "enumitem"):
+            out.append(
+                rf"\setlist[itemize]{{itemsep={self.itemsep_pt:g}pt, "
+                rf"topsep={self.itemsep_pt + 1:g}pt, parsep=0pt}}"
+            )
+        if _loads_package(preamble, "titlesec"):
+            out.append(
+                rf"\titlespacing*{{\section}}{{0pt}}"
+                rf"{{{self.section_before_pt:g}pt}}{{{self.section_after_pt:g}pt}}"
+            )
+        return out
+
+
+# loosest → tightest; each step should never make the document longer
+LAYOUT_LADDER = [
+    Layout(),
+    Layout(itemsep_pt=0.5, section_before_pt=6, section_after_pt=3),
+    Layout(itemsep_pt=0, section_before_pt=6, section_after_pt=3),
+    Layout(margin_in=0.45, itemsep_pt=0, section_before_pt=5, section_after_pt=2),
+    Layout(
+        margin_in=0.4,
+        font_size_pt=10.5,
+        itemsep_pt=0,
+        section_before_pt=5,
+        section_after_pt=2,
+    ),
+    Layout(
+        margin_in=0.4,
+        font_size_pt=10,
+        itemsep_pt=0,
+        section_before_pt=4,
+        section_after_pt=2,
+    ),
+    Layout(
+        margin_in=0.35,
+        font_size_pt=9.5,
+        itemsep_pt=0,
+        section_before_pt=3,
+        section_after_pt=1,
+    ),
+    Layout(
+        margin_in=0.3,
+        font_size_pt=9,
+        itemsep_pt=0,
+        section_before_pt=2,
+        section_after_pt=1,
+    ),
+]
+
+
+def _loads_package(preamble: str, package: str) -> bool:
+    return (
+        re.search(rf"\\usepackage(\[[^\]]*\])?\{{[^}}]*\b{package}\b", preamble)
+        is not None
+    )
+
+
+def apply_layout(tex: str, layout: Layout) -> str:
+    """
+    Inserts the layout overrides right after \\begin{document}. Works on
+    rendered and LLM-written documents alike.
+    """
+    marker = r"\begin{document}"
+    head, sep, body = tex.partition(marker)
+    if not sep:
+        return tex
+    return head + sep + "\n" + "\n".join(layout.commands(head)) + "\n" + body
+
+
+_LATEX_SPECIALS = {
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+    "<": r"\textless{}",
+    ">": r"\textgreater{}",
+}
+_SPECIALS_RE = re.compile("|".join(re.escape(c) for c in _LATEX_SPECIALS))
+
+
+def escape_latex(text: Optional[str]) -> str:
+    """
+    Escapes LaTeX special characters in plain text.
+    """
+    if not text:
+        return ""
+    return _SPECIALS_RE.sub(lambda m: _LATEX_SPECIALS[m.group()], text.strip())
+
+
+def _href(url: str) -> str:
+    target = url if re.match(r"^[a-z]+:", url) else f"https://{url}"
+    target = target.replace("\\", "/").replace("%", r"\%").replace("#", r"\#")
+    return rf"\href{{{target}}}{{{escape_latex(url)}}}"
+
+
+def _itemize(items: Iterable[str]) -> List[str]:
+    items = [escape_latex(i) for i in items if i and i.strip()]
+    if not items:
+        return []
+    return [r"\begin{itemize}", *(rf"\item {i}" for i in items), r"\end{itemize}"]
+
+
+def _section(title: str, lines: List[str]) -> List[str]:
+    if not lines:
+        return []
+    return [rf"\section{{{title}}}", *lines, ""]
+
+
+def _entry(
+    title: Optional[str],
+    subtitle: Optional[str],
+    place: Optional[str],
+    dates: Optional[str],
+) -> str:
+    # no italic row when there is nothing to put on it
+    if not ((subtitle or "").strip() or (place or "").strip()):
+        return rf"\resumetitle{{{escape_latex(title)}}}{{{escape_latex(dates)}}}"
+    return (
+        rf"\resumeentry{{{escape_latex(title)}}}{{{escape_latex(subtitle)}}}"
+        rf"{{{escape_latex(place)}}}{{{escape_latex(dates)}}}"
+    )
+
+
+def render_body(resume: TailoredResume) -> str:
+    """
+    Renders everything from \\begin{document} to \\end{document}.
+    """
+    header = resume.header
+    contact = [
+        escape_latex(c) for c in (header.email, header.phone, header.location) if c
+    ]
+    contact += [_href(link) for link in header.links if link]
+
+    lines = [
+        r"\begin{document}",
+        r"\begin{center}",
+        rf"{{\LARGE\bfseries {escape_latex(header.name)}}}",
+    ]
+    if contact:
+        lines[-1] += r"\\[2pt]"
+        lines.append(r" \textbar{} ".join(contact))
+    lines += [r"\end{center}", ""]
+
+    if resume.summary:
+        lines += _section("Summary", [escape_latex(resume.summary)])
+
+    lines += _section(
+        "Skills",
+        [
+            rf"\textbf{{{escape_latex(g.category)}:}} "
+            + ", ".join(escape_latex(i) for i in g.items)
+            + r"\par"
+            for g in resume.skills
+            if g.items
+        ],
+    )
+
+    experience = []
+    for e in resume.experience:
+        experience.append(_entry(e.title, e.organization, e.location, e.dates))
+        experience += _itemize(e.bullets)
+    lines += _section("Experience", experience)
+
+    projects = []
+    for p in resume.projects:
+        projects.append(_entry(p.name, p.technologies, "", p.dates))
+        projects += _itemize(p.bullets)
+    lines += _section("Projects", projects)
+
+    education = []
+    for ed in resume.education:
+        education.append(_entry(ed.institution, ed.degree, ed.location, ed.dates))
+        education += _itemize(ed.details)
+    lines += _section("Education", education)
+
+    lines += _section("Certifications", _itemize(resume.certifications))
+
+    lines.append(r"\end{document}")
+    return "\n".join(lines) + "\n"
+
+
+def render_resume(resume: TailoredResume) -> str:
+    """
+    Renders a complete, compilable .tex document.
+    """
+    return PREAMBLE + "\n" + render_body(resume)
+
+
+def write_resume_tex(resume: TailoredResume, tex_path: str) -> str:
+    with open(tex_path, "w", encoding="utf-8") as f:
+        f.write(render_resume(resume))
+    return tex_path
@@ -2,7 +2,8 @@
 import sys
 import warnings
 from datetime import datetime
-from resume_tailor.crew import ResumeTailor
+from resume_tailor.crew import LATEX_MODE, ResumeTailor, TEX_FILE_NAME
+from resume_tailor.latex_renderer import write_resume_tex
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
@@ -21,10 +22,13 @@ def run():
         "jd_text": jd,
         "resume_url": resume,  # or the parsed text directly
         "current_year": str(datetime.now().year),
+        "output_dir": ".",
     }
 
     try:
-        ResumeTailor().crew().kickoff(inputs=inputs)
+        result = ResumeTailor().crew().kickoff(inputs=inputs)
+        if LATEX_MODE == "template":
+            write_resume_tex(result.pydantic, TEX_FILE_NAME)
     except Exception as e:
         raise Exception(f"An error occurred while running the crew: {e}")
 
@@ -37,6 +41,7 @@ def train():
         "jd_text": jd,
         "resume_url": resume,
         "current_year": str(datetime.now().year),
+        "output_dir": ".",
     }
     try:
         ResumeTailor().crew().train(
@@ -64,6 +69,7 @@ def test():
         "jd_text": jd,
         "resume_url": resume,
         "current_year": str(datetime.now().year),
+        "output_dir": ".",
     }
 
     try:
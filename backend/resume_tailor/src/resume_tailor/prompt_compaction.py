@@ -0,0 +1,304 @@
+"""
+Local (non-LLM) prompt compaction.
+
+preprocess_jd cleans the pasted job description before jd_task sees it:
+whitespace normalisation, boilerplate removal (curated phrases and
+sections, plus sentences an optional learned index has seen across many
+postings), sentence dedupe and a length cap.
+
+compact_task_output trims a finished task's output to what downstream
+tasks read from their context.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Set
+
+from resume_tailor.instrumentation import record
+from resume_tailor.scheduling import estimate_tokens
+
+# bump when the rules change so stage caches keyed on compacted text roll over
+COMPACTION_VERSION = "2"
+JD_MAX_CHARS = int(os.environ.get("JD_MAX_CHARS", 8000))
+
+# sentences/lines that never carry role requirements
+BOILERPLATE_PATTERNS = [
+    r"\bequal (employment )?opportunit(y|ies)\b",
+    r"\bregardless of (their )?(race|colou?r|religion|sex|gender|age|national origin)",
+    r"\b(sexual orientation|gender identity|national origin|veteran status)\b",
+    r"\bprotected (class|characteristic|status)",
+    r"\breasonable accommodations?\b",
+    r"\baffirmative action\b",
+    r"\be-verify\b",
+    r"\b(applicant )?privacy (notice|policy)\b",
+    r"\b401\(?k\)?|\bdental\b|\bvision (insurance|coverage)\b",
+    r"\b(paid time off|unlimited pto|parental leave|employee assistance)\b",
+    r"\bwellness (stipend|program)",
+    r"\bwe('re| are) (proud|committed) to\b",
+    r"\b(click|apply) (here|now|today)\b",
+    r"\bfollow us on\b",
+    r"\bunsolicited (resumes|applications)\b",
+]
+_BOILERPLATE_RE = re.compile("|".join(BOILERPLATE_PATTERNS), re.I)
+
+# headings whose whole section is boilerplate
+_SKIP_HEADING_RE = re.compile(
+    r"^(about (us|the (company|team))|who we are|benefits|perks|"
+    r"(perks|compensation) (&|and) benefits|what we offer|why (join|work (with|at)) us|"
+    r"equal (employment )?opportunity|eeo( statement)?|our (values|culture|mission)|"
+    r"life at .{1,40}|how to apply)\s*:?$",
+    re.I,
+)
+# headings (or inline labels) of the sections that state the role itself;
+# their sentences are never learned as boilerplate, however often they repeat
+_REQUIREMENT_HEADING_RE = re.compile(
+    r"^(requirements?|(minimum |preferred |basic )?qualifications|responsibilities|"
+    r"(key |core )?skills|must[- ]haves?|nice[- ]to[- ]haves?|(about )?the role|"
+    r"(the )?role overview|what you('ll| will) (do|bring|need)|what we('re| are) looking for|"
+    r"who you are|you (have|bring|will)|your (role|responsibilities|profile)|"
+    r"experience|tech(nology)? stack|duties)\b",
+    re.I,
+)
+_HEADING_RE = re.compile(r"^[^.!?]{1,60}:$|^[A-Z][A-Za-z &/'-]{1,40}$")
+_LABEL_RE = re.compile(r"^([A-Za-z][\w &/'-]{0,40}):\s+(?=\S)")
+_BULLET_RE = re.compile(r"^\s*(?:[-*•·▪◦‣●]|\d+[.)])\s+")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
+_SPACES_RE = re.compile(r"[ \t ]+")
+
+
+def normalize_whitespace(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def sentence_key(sentence: str) -> str:
+    """
+    Case/punctuation-insensitive identity of a sentence, used for dedupe
+    and by the learned boilerplate index.
+    """
+    core = re.sub(r"[\W_]+", " ", sentence.lower()).strip()
+    return hashlib.sha1(core.encode("utf-8")).hexdigest()[:16]
+
+
+def split_sentences(line: str) -> List[str]:
+    return [s for s in _SENTENCE_SPLIT_RE.split(line) if s.strip()]
+
+
+@dataclass
+class PreprocessedJD:
+    text: str
+    original_chars: int
+    sentence_keys: List[str] = field(default_factory=list)
+    # the kept sentences a boilerplate index may learn from: outside the
+    # requirement sections and not bullets
+    learnable_keys: List[str] = field(default_factory=list)
+    dropped_boilerplate: int = 0
+    dropped_duplicates: int = 0
+    truncated: bool = False
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.original_chars - len(self.text)) // 4
+
+
+def preprocess_jd(
+    text: str,
+    known_boilerplate: Optional[Callable[[Iterable[str]], Set[str]]] = None,
+) -> PreprocessedJD:
+    """
+    `known_boilerplate(keys)` returns the sentence keys a learned index
+    considers boilerplate. They are only dropped outside the requirement
+    sections, and not at all when they make up most of the JD; curated
+    patterns apply either way.
+    """
+    start = time.perf_counter()
+    original = text or ""
+    lines = normalize_whitespace(original).splitlines()
+    result = PreprocessedJD(text="", original_chars=len(original))
+
+    # (line prefix, [sentences] or None for a heading, learnable) per kept line
+    parsed = []
+    all_keys = []
+    skipping = False
+    requirements = False
+    for line in lines:
+        if not line:
+            parsed.append(("", [], False))
+            continue
+        if _SKIP_HEADING_RE.match(line):
+            skipping = True
+        elif _HEADING_RE.match(line):
+            skipping = False
+            requirements = bool(_REQUIREMENT_HEADING_RE.match(line))
+        if skipping:
+            result.dropped_boilerplate += 1
+            continue
+        if _HEADING_RE.match(line):
+            # headings repeat across postings but must not be learned away
+            parsed.append((line, None, False))
+            continue
+        # bullets and inline labels ("Requirements: ...") stay out of the
+        # sentences so they don't defeat dedupe
+        prefix, body = "", line
+        bullet = _BULLET_RE.match(body)
+        if bullet:
+            prefix, body = "- ", body[bullet.end() :]
+        learnable = not bullet and not requirements
+        label = _LABEL_RE.match(body)
+        if label:
+            prefix, body = prefix + label.group(1) + ": ", body[label.end() :]
+            if _REQUIREMENT_HEADING_RE.match(label.group(1)):
+                learnable = False
+        sentences = split_sentences(body)
+        parsed.append((prefix, sentences, learnable))
+        all_keys += [sentence_key(s) for s in sentences]
+
+    learned = known_boilerplate(set(all_keys)) if known_boilerplate else set()
+    if learned:
+        # a popular posting's own sentences can reach the learned index too;
+        # never let it strip most of a JD, the curated patterns still apply
+        chars = learned_chars = 0
+        for _, sentences, learnable in parsed:
+            for sentence in sentences or ():
+                if _BOILERPLATE_RE.search(sentence):
+                    continue
+                chars += len(sentence)
+                if learnable and sentence_key(sentence) in learned:
+                    learned_chars += len(sentence)
+        if learned_chars * 2 > chars:
+            learned = set()
+
+    seen = set()
+    out_lines = []
+    for prefix, sentences, learnable in parsed:
+        if sentences is None:
+            out_lines.append(prefix)
+            continue
+        kept = []
+        for sentence in sentences:
+            key = sentence_key(sentence)
+            if _BOILERPLATE_RE.search(sentence) or (learnable and key in learned):
+                result.dropped_boilerplate += 1
+                continue
+            if key in seen:
+                result.dropped_duplicates += 1
+                continue
+            seen.add(key)
+            result.sentence_keys.append(key)
+            if learnable:
+                result.learnable_keys.append(key)
+            kept.append(sentence)
+        if kept:
+            out_lines.append(prefix + " ".join(kept))
+        elif not sentences and out_lines and out_lines[-1]:
+            out_lines.append("")
+    # dropped sections/sentences can leave a run of blank lines behind
+    cleaned = "\n".join(out_lines).strip()
+    cleaned = re.sub(r"\n{3,}", "\n\n", cleaned)
+
+    if len(cleaned) > JD_MAX_CHARS:
+        cut = cleaned.rfind("\n", 0, JD_MAX_CHARS)
+        cleaned = cleaned[: cut if cut > JD_MAX_CHARS // 2 else JD_MAX_CHARS].rstrip()
+        result.truncated = True
+
+    result.text = cleaned
+    record(
+        "preprocess",
+        "jd_text",
+        time.perf_counter() - start,
+        saved_tokens=result.saved_tokens,
+    )
+    return result
+
+
+# ---------------- inter-task context ----------------
+
+JD_ANALYSIS_KEYS = ("skills", "technologies", "responsibilities", "qualifications")
+
+
+def _json_object(raw: str) -> Optional[dict]:
+    start, end = raw.find("{"), raw.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        value = json.loads(raw[start : end + 1])
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _dedupe(items) -> list:
+    seen, out = set(), []
+    for item in items:
+        text = normalize_whitespace(str(item))
+        if text and text.lower() not in seen:
+            seen.add(text.lower())
+            out.append(text)
+    return out
+
+
+def compact_jd_analysis(raw: str) -> str:
+    """
+    Only the four lists writer_task uses, deduped, as compact JSON.
+    """
+    data = _json_object(raw)
+    if data is None:
+        return normalize_whitespace(raw)
+    compact = {}
+    for key in JD_ANALYSIS_KEYS:
+        values = data.get(key)
+        if isinstance(values, list):
+            values = _dedupe(values)
+        if values:
+            compact[key] = values
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_resume_text(raw: str) -> str:
+    """
+    The extracted text itself, unwrapped from its JSON envelope, with PDF
+    extraction noise removed: hyphenated line breaks, spacing runs and
+    lines repeated on every page (headers, footers).
+    """
+    data = _json_object(raw)
+    if data is not None and isinstance(data.get("resume_text"), str):
+        raw = data["resume_text"]
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", raw)
+    seen, lines = set(), []
+    for line in normalize_whitespace(text).splitlines():
+        if line and len(line) < 80 and line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+CONTEXT_VIEWS = {
+    "jd_task": compact_jd_analysis,
+    "resume_task": compact_resume_text,
+}
+
+
+def compact_task_output(output) -> None:
+    """
+    Task callback: rewrites `output.raw` in place, which is what downstream
+    tasks receive as context (and what gets cached and checkpointed).
+    """
+    view = CONTEXT_VIEWS.get(output.name)
+    if view is None or output.pydantic is not None:
+        return
+    start = time.perf_counter()
+    before = output.raw
+    output.raw = view(before)
+    record(
+        "compact",
+        output.name,
+        time.perf_counter() - start,
+        saved_tokens=max(0, estimate_tokens(before) - estimate_tokens(output.raw)),
+    )
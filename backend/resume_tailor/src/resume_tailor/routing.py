@@ -0,0 +1,252 @@
+"""
+Model routing for the crew's LLM calls.
+
+A routing policy (config/routing.yaml) gives every stage a model,
+temperature and max_tokens. max_tokens may be sized from the prompt, and
+rules can switch a stage to another tier based on the prompt's size or on
+how well the resume already covers the JD (a keyword check, no LLM).
+InstrumentedLLM routes each call of a task before making it and records
+the choice on the call's span; routing_report sums those per stage.
+"""
+
+import contextvars
+import json
+import math
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import yaml
+from resume_tailor.scheduling import estimate_tokens
+
+ROUTING_CONFIG = os.environ.get(
+    "RESUME_TAILOR_ROUTING_CONFIG",
+    os.path.join(os.path.dirname(__file__), "config", "routing.yaml"),
+)
+# "fixed" runs every stage on the models it always used
+ROUTING_POLICY = os.environ.get("RESUME_TAILOR_ROUTING", "tiered")
+# sized max_tokens are rounded up to a multiple of this
+TOKEN_STEP = 256
+
+# JD analysis lists the coverage check looks for in the resume
+COVERAGE_KEYS = ("skills", "technologies")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and for in of on or the to with using experience knowledge".split()
+)
+
+_route = contextvars.ContextVar("resume_tailor_route", default=None)
+
+
+@dataclass(frozen=True)
+class Route:
+    policy: str
+    stage: str
+    model: str
+    temperature: Optional[float]
+    max_tokens: int
+    rule: str
+    prompt_tokens: int
+    coverage: Optional[float] = None
+
+    def span_fields(self) -> dict:
+        """
+        What the call's span records besides its model and actual tokens.
+        """
+        return {
+            "policy": self.policy,
+            "rule": self.rule,
+            "max_tokens": self.max_tokens,
+            "coverage": self.coverage,
+        }
+
+
+@lru_cache(maxsize=None)
+def _policies(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def policy_config(policy: Optional[str] = None) -> dict:
+    """
+    Stage settings of `policy` (the configured one by default). Raises
+    ValueError for a policy the routing config does not define.
+    """
+    policy = policy or ROUTING_POLICY
+    policies = _policies(ROUTING_CONFIG)
+    if policy not in policies:
+        raise ValueError(
+            f"unknown routing policy {policy!r}; expected one of {sorted(policies)}"
+        )
+    return policies[policy]
+
+
+def stage_policy(stage: str, policy: Optional[str] = None) -> Optional[dict]:
+    """
+    A stage's settings and rules under `policy`; None leaves the stage on
+    its agent's LLM as configured.
+    """
+    return policy_config(policy).get(stage)
+
+
+def _words(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def jd_terms(jd_analysis: str) -> list:
+    """
+    The skills and technologies of a (compacted) jd_task output.
+    """
+    start, end = jd_analysis.find("{"), jd_analysis.rfind("}")
+    try:
+        data = json.loads(jd_analysis[start : end + 1]) if start >= 0 else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return []
+    terms = []
+    for key in COVERAGE_KEYS:
+        values = data.get(key)
+        if isinstance(values, list):
+            terms += [str(v) for v in values if str(v).strip()]
+    return terms
+
+
+def coverage(jd_analysis: str, resume_text: str) -> Optional[float]:
+    """
+    Share of the JD's skills and technologies the resume already names:
+    a term counts when every word of it appears in the resume. None when
+    the analysis lists no terms.
+    """
+    terms = [_words(t) for t in jd_terms(jd_analysis)]
+    terms = [t for t in terms if t]
+    if not terms:
+        return None
+    resume_words = _words(resume_text)
+    return round(sum(t <= resume_words for t in terms) / len(terms), 3)
+
+
+def _context_outputs(task) -> dict:
+    context = getattr(task, "context", None)
+    if not isinstance(context, list):
+        return {}
+    return {t.name: t.output.raw for t in context if t.output is not None}
+
+
+def _task_coverage(task) -> Optional[float]:
+    outputs = _context_outputs(task)
+    if "jd_task" not in outputs or "resume_task" not in outputs:
+        return None
+    return coverage(outputs["jd_task"], outputs["resume_task"])
+
+
+def _matches(when: dict, prompt_tokens: int, score: Optional[float]) -> bool:
+    if (
+        "prompt_tokens_at_most" in when
+        and prompt_tokens > when["prompt_tokens_at_most"]
+    ):
+        return False
+    if (
+        "prompt_tokens_at_least" in when
+        and prompt_tokens < when["prompt_tokens_at_least"]
+    ):
+        return False
+    if "coverage_at_least" in when:
+        if score is None or score < when["coverage_at_least"]:
+            return False
+    return True
+
+
+def sized_max_tokens(settings: dict, prompt_tokens: int) -> int:
+    cap = settings["max_tokens"]
+    ratio = settings.get("output_ratio")
+    if ratio is None:
+        return cap
+    wanted = max(prompt_tokens * ratio, settings.get("min_tokens", 0))
+    return min(cap, math.ceil(wanted / TOKEN_STEP) * TOKEN_STEP)
+
+
+def route(task, messages, policy: Optional[str] = None) -> Optional[Route]:
+    """
+    The model settings for the next LLM call of `task`, or None for calls
+    the policy leaves alone (no task, or a stage it does not list).
+    """
+    stage = getattr(task, "name", None)
+    config = stage_policy(stage, policy) if stage else None
+    if config is None:
+        return None
+    prompt_tokens = estimate_tokens(messages)
+    score = _task_coverage(task)
+    settings, rule = config, "default"
+    for candidate in config.get("rules") or ():
+        if _matches(candidate.get("when") or {}, prompt_tokens, score):
+            settings = {**config, **candidate}
+            rule = candidate["name"]
+            break
+    return Route(
+        policy=policy or ROUTING_POLICY,
+        stage=stage,
+        model=settings["model"],
+        temperature=settings.get("temperature"),
+        max_tokens=sized_max_tokens(settings, prompt_tokens),
+        rule=rule,
+        prompt_tokens=prompt_tokens,
+        coverage=score,
+    )
+
+
+@contextmanager
+def routed(choice: Optional[Route]):
+    """
+    Makes `choice` the route of the LLM call made inside the block.
+    """
+    token = _route.set(choice)
+    try:
+        yield choice
+    finally:
+        _route.reset(token)
+
+
+def current_route() -> Optional[Route]:
+    return _route.get()
+
+
+def routing_report(spans, task_ids=None) -> dict:
+    """
+    Per-stage routing of a job from its LLM spans: the model and rule of
+    the last call, and the calls' tokens, seconds and estimated cost.
+    `task_ids` limits it to one crew's tasks.
+    """
+    stages = {}
+    policy = None
+    for span in spans:
+        if span["kind"] != "llm" or "rule" not in span:
+            continue
+        if task_ids is not None and span.get("task_id") not in task_ids:
+            continue
+        policy = span["policy"]
+        stage = stages.setdefault(
+            span["task"],
+            {
+                "calls": 0,
+                "seconds": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+            },
+        )
+        stage.update(
+            model=span["model"],
+            rule=span["rule"],
+            max_tokens=span["max_tokens"],
+            coverage=span.get("coverage"),
+        )
+        stage["calls"] += 1
+        stage["seconds"] = round(stage["seconds"] + span["seconds"], 4)
+        for field in ("prompt_tokens", "completion_tokens"):
+            stage[field] += span.get(field) or 0
+        stage["cost_usd"] = round(stage["cost_usd"] + (span.get("cost_usd") or 0), 6)
+    return {"policy": policy or ROUTING_POLICY, "stages": stages}
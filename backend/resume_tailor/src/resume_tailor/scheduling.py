@@ -0,0 +1,102 @@
+"""
+Hook through which the host process gates every LLM call.
+
+The crew only knows the LLMScheduler interface; the worker installs an
+implementation (flask_app/llm_scheduler.py keeps shared token buckets in
+Redis) and tags each job with a priority.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+import litellm
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+_scheduler = None
+_priority = contextvars.ContextVar("resume_tailor_llm_priority", default=None)
+# batch items run on pool threads that don't inherit contextvars; a worker
+# process runs one job at a time, so they fall back to the process priority
+_process_priority = INTERACTIVE
+
+
+class LLMScheduler:
+    """
+    No-op scheduler: calls go straight to the provider and are not retried.
+    """
+
+    max_retries = 0
+
+    def acquire(self, model: str, tokens: int, priority: str) -> None:
+        """
+        Blocks until `model` may be called with about `tokens` tokens.
+        """
+
+    def settle(self, model: str, extra_tokens: int) -> None:
+        """
+        Charges tokens the call used beyond what acquire reserved.
+        """
+
+    def backoff(self, model: str, retry_after: Optional[float], attempt: int) -> None:
+        """
+        Called after the provider rate-limited `model`.
+        """
+
+
+def set_scheduler(scheduler: Optional[LLMScheduler]) -> None:
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    return _scheduler
+
+
+def current_priority() -> str:
+    return _priority.get() or _process_priority
+
+
+@contextmanager
+def priority(level: str):
+    """
+    Runs the LLM calls made inside the block at `level`.
+    """
+    global _process_priority
+    token = _priority.set(level)
+    previous, _process_priority = _process_priority, level
+    try:
+        yield
+    finally:
+        _process_priority = previous
+        _priority.reset(token)
+
+
+def estimate_tokens(messages) -> int:
+    """
+    Rough prompt size (4 characters per token), the same order of
+    magnitude providers use when they count a request against a limit.
+    """
+    if isinstance(messages, str):
+        return len(messages) // 4 + 1
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4 + 1
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """
+    None if `error` is not a rate limit; otherwise the provider's
+    Retry-After in seconds, or 0.0 when it gave none.
+    """
+    if not (
+        isinstance(error, litellm.RateLimitError)
+        or getattr(error, "status_code", None) == 429
+    ):
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    return 0.0
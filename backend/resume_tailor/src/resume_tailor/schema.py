@@ -0,0 +1,52 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class Header(BaseModel):
+    name: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    location: Optional[str] = None
+    links: List[str] = Field(
+        default_factory=list, description="Profile URLs (LinkedIn, GitHub, site)."
+    )
+
+
+class SkillGroup(BaseModel):
+    category: str = Field(..., description="e.g. Languages, Frameworks, Tools")
+    items: List[str]
+
+
+class ExperienceEntry(BaseModel):
+    title: str
+    organization: str
+    location: Optional[str] = None
+    dates: Optional[str] = None
+    bullets: List[str] = Field(default_factory=list)
+
+
+class ProjectEntry(BaseModel):
+    name: str
+    technologies: Optional[str] = None
+    dates: Optional[str] = None
+    bullets: List[str] = Field(default_factory=list)
+
+
+class EducationEntry(BaseModel):
+    institution: str
+    degree: Optional[str] = None
+    location: Optional[str] = None
+    dates: Optional[str] = None
+    details: List[str] = Field(default_factory=list)
+
+
+class TailoredResume(BaseModel):
+    """Structured resume emitted by writer_task and rendered to LaTeX locally."""
+
+    header: Header
+    summary: Optional[str] = None
+    skills: List[SkillGroup] = Field(default_factory=list)
+    experience: List[ExperienceEntry] = Field(default_factory=list)
+    projects: List[ProjectEntry] = Field(default_factory=list)
+    education: List[EducationEntry] = Field(default_factory=list)
+    certifications: List[str] = Field(default_factory=list)
@@ -0,0 +1,213 @@
+"""
+Streaming for the LLM LaTeX stages.
+
+While a job runs inside `watching(...)`, InstrumentedLLM streams the
+responses of the watched tasks through a LatexStreamWatcher instead of
+waiting for the whole answer. The watcher mirrors the document to the
+.tex path as it arrives, reports progress, stops reading once
+\\end{document} has arrived, and aborts answers that are clearly not a
+LaTeX document, so the call can be retried before thousands of tokens are
+spent on it.
+"""
+
+import contextvars
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# an answer must show \documentclass within this many characters
+STREAM_HEAD_CHARS = int(os.environ.get("LATEX_STREAM_HEAD_CHARS", 400))
+# give up on answers that ramble this long before any document starts
+STREAM_MAX_PREAMBLE_CHARS = 4000
+STREAM_PROGRESS_INTERVAL = float(os.environ.get("LATEX_STREAM_PROGRESS_INTERVAL", 1.0))
+# re-asks after an aborted stream, per call
+STREAM_ABORT_RETRIES = int(os.environ.get("LATEX_STREAM_ABORT_RETRIES", 1))
+
+FINAL_ANSWER = "Final Answer:"
+DOCUMENTCLASS = r"\documentclass"
+BEGIN_DOCUMENT = r"\begin{document}"
+END_DOCUMENT = r"\end{document}"
+
+_FENCE_RE = re.compile(r"^\s*```[A-Za-z]*[ \t]*\n")
+_SECTION_RE = re.compile(r"\\section\*?\{([^}]*)\}")
+
+_watch = contextvars.ContextVar("resume_tailor_stream_watch", default=None)
+# crew tasks may run on threads that don't inherit contextvars; a worker
+# process runs one job at a time
+_process_watch = None
+
+
+class StreamAborted(Exception):
+    """
+    The streamed answer cannot become a valid document.
+    """
+
+
+class LatexStreamWatcher:
+    """
+    Fed the answer chunk by chunk. `text` is the full answer so far (with
+    the agent's "Thought: … Final Answer:" lead-in), `latex` the document
+    part of it.
+    """
+
+    def __init__(
+        self,
+        task_name: str,
+        tex_path: Optional[str] = None,
+        on_progress: Optional[Callable[[str, dict], None]] = None,
+    ):
+        self.task_name = task_name
+        self.tex_path = tex_path
+        self.on_progress = on_progress
+        self.text = ""
+        self.latex_start = None
+        self.complete = False
+        self._written = 0
+        self._file = None
+        self._last_progress = 0.0
+        self._section = None
+
+    @property
+    def latex(self) -> str:
+        if self.latex_start is None:
+            return ""
+        latex = self.text[self.latex_start :].lstrip()
+        if latex.startswith("```") and "\n" not in latex:
+            # wait for the whole fence line so the document only ever grows
+            return ""
+        return _FENCE_RE.sub("", latex, count=1)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Adds a chunk; returns True once the document is complete and the
+        rest of the stream can be dropped. Raises StreamAborted.
+        """
+        scan_from = max(0, len(self.text) - len(FINAL_ANSWER))
+        self.text += chunk
+
+        if self.latex_start is None:
+            marker = self.text.find(FINAL_ANSWER, scan_from)
+            if marker >= 0:
+                self.latex_start = marker + len(FINAL_ANSWER)
+            else:
+                doc = self.text.find(DOCUMENTCLASS, scan_from)
+                if doc >= 0:
+                    self.latex_start = doc
+                elif len(self.text) > STREAM_MAX_PREAMBLE_CHARS:
+                    raise StreamAborted("no LaTeX document in the answer")
+                else:
+                    return False
+
+        latex = self.latex
+        if not latex:
+            return False
+        self._validate(latex)
+        end = latex.find(END_DOCUMENT)
+        if end >= 0:
+            latex = latex[: end + len(END_DOCUMENT)] + "\n"
+            # drop whatever the model added after the document
+            self.text = self.text[: self.latex_start] + "\n" + latex
+            self.complete = True
+
+        self._write(latex)
+        self._report(latex)
+        return self.complete
+
+    def _validate(self, latex: str) -> None:
+        head = latex[:STREAM_HEAD_CHARS]
+        doc = latex.find(DOCUMENTCLASS)
+        if doc < 0:
+            if len(head) >= STREAM_HEAD_CHARS:
+                raise StreamAborted(
+                    f"no \\documentclass in the first {STREAM_HEAD_CHARS} characters"
+                )
+            return
+        begin = latex.find(BEGIN_DOCUMENT)
+        if 0 <= begin < doc:
+            raise StreamAborted("\\begin{document} before \\documentclass")
+        if latex.find(DOCUMENTCLASS, doc + 1) >= 0:
+            raise StreamAborted("the document starts over")
+
+    def _write(self, latex: str) -> None:
+        if self.tex_path is None or len(latex) <= self._written:
+            return
+        if self._file is None:
+            self._file = open(self.tex_path, "w", encoding="utf-8")
+        self._file.write(latex[self._written :])
+        self._file.flush()
+        self._written = len(latex)
+
+    def _report(self, latex: str) -> None:
+        sections = _SECTION_RE.findall(latex[-2000:])
+        if sections:
+            self._section = sections[-1]
+        now = time.monotonic()
+        if self.on_progress is None or (
+            not self.complete and now - self._last_progress < STREAM_PROGRESS_INTERVAL
+        ):
+            return
+        self._last_progress = now
+        self.on_progress(
+            self.task_name,
+            {
+                "chars": len(latex),
+                "section": self._section,
+                "preamble_done": BEGIN_DOCUMENT in latex,
+                "complete": self.complete,
+            },
+        )
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@contextmanager
+def watching(
+    tasks: Iterable[str],
+    tex_path: Optional[str] = None,
+    on_progress: Optional[Callable[[str, dict], None]] = None,
+):
+    """
+    Streams the LLM calls of `tasks` made inside the block through a
+    LatexStreamWatcher writing to `tex_path`.
+    """
+    global _process_watch
+    config = {"tasks": set(tasks), "tex_path": tex_path, "on_progress": on_progress}
+    token = _watch.set(config)
+    previous, _process_watch = _process_watch, config
+    try:
+        yield
+    finally:
+        _process_watch = previous
+        _watch.reset(token)
+
+
+def watcher_for(task) -> Optional[LatexStreamWatcher]:
+    config = _watch.get() or _process_watch
+    name = getattr(task, "name", None)
+    if config is None or name not in config["tasks"]:
+        return None
+    return LatexStreamWatcher(name, config["tex_path"], config["on_progress"])
+
+
+def retry_messages(messages, error: StreamAborted) -> list:
+    """
+    The original prompt plus a note on why the last answer was cut off.
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return [
+        *messages,
+        {
+            "role": "user",
+            "content": (
+                f"Your previous answer was stopped: {error}. Reply with the "
+                "complete LaTeX document only, starting with \\documentclass, "
+                "without markdown fences."
+            ),
+        },
+    ]
@@ -28,13 +28,15 @@ class LatexToPDFTool(BaseTool):
         command = ["pdflatex", "-interaction=nonstopmode", file_name]
 
         try:
-            # Run pdflatex 2 times for proper references
-            for _ in range(2):
+            # Rerun pdflatex only while it asks for it (references changed)
+            for _ in range(3):
                 result = subprocess.run(
                     command, cwd=work_dir, capture_output=True, text=True
                 )
                 if result.returncode != 0:
                     return f"PDF compilation failed:\n{result.stdout}\n{result.stderr}"
+                if "Rerun to get" not in result.stdout:
+                    break
 
             pdf_file = os.path.join(work_dir, base_name + ".pdf")
             if not os.path.exists(pdf_file):
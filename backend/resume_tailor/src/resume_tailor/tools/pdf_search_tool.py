@@ -1,51 +1,107 @@
 # tools/dynamic_pdf_tool.py
 from crewai.tools import BaseTool
-from crewai_tools import PDFSearchTool
-from typing import Type
+from typing import Literal, Optional, Type
 from pydantic import BaseModel, Field
+from PyPDF2 import PdfReader
+import hashlib
 import os
-import tempfile
-import requests
+import threading
+from resume_tailor.downloads import fetch_pdf, is_url
+from resume_tailor.instrumentation import timed
+
+# persistent vector index for "search" mode, one collection per PDF hash
+PDF_INDEX_DIR = os.environ.get(
+    "PDF_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "resume_tailor", "pdf_index"),
+)
+
+_search_tools = {}
+_search_tools_lock = threading.Lock()
+
+
+def extract_pdf_text(local_pdf_path: str) -> str:
+    """
+    Extracts the full text of a PDF locally with PyPDF2 (no embeddings).
+    """
+    reader = PdfReader(local_pdf_path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    return "\n".join(p.strip() for p in pages if p.strip())
+
+
+def _search_tool_for(local_pdf_path: str, digest: str):
+    """
+    Returns a PDFSearchTool for this PDF, reusing the in-process instance
+    and the on-disk index when the same content was seen before.
+    """
+    with _search_tools_lock:
+        tool = _search_tools.get(digest)
+        if tool is None:
+            # imported lazily so plain extraction never loads the RAG stack
+            from crewai_tools import PDFSearchTool
+
+            tool = PDFSearchTool(
+                pdf=local_pdf_path,
+                config=dict(
+                    vectordb=dict(
+                        provider="chroma",
+                        config=dict(
+                            collection_name=f"resume_{digest[:32]}",
+                            dir=PDF_INDEX_DIR,
+                        ),
+                    ),
+                ),
+            )
+            _search_tools[digest] = tool
+        return tool
 
 
 class DynamicPDFInput(BaseModel):
     pdf_path: str = Field(..., description="Local path or HTTP URL to the PDF file.")
-    query: str = Field(
-        None, description="Optional question to search for within the PDF."
+    mode: Literal["extract", "search"] = Field(
+        "extract",
+        description=(
+            "'extract' returns the full text of the PDF. "
+            "'search' answers `query` with semantic search."
+        ),
+    )
+    query: Optional[str] = Field(
+        None, description="Question to search for within the PDF ('search' mode)."
     )
 
 
 class DynamicPDFTool(BaseTool):
     name: str = "Dynamic PDF Tool"
     description: str = (
-        "Downloads (if needed) and searches a given PDF file dynamically."
+        "Downloads (if needed) a PDF and returns its full text, or searches it "
+        "semantically when mode is 'search'."
     )
     args_schema: Type[BaseModel] = DynamicPDFInput
 
-    def _run(self, pdf_path: str, query: str = None) -> str:
+    def _run(
+        self, pdf_path: str, mode: str = "extract", query: Optional[str] = None
+    ) -> str:
+        with timed("tool", self.name, mode=mode):
+            return self._process(pdf_path, mode, query)
+
+    def _process(self, pdf_path: str, mode: str, query: Optional[str]) -> str:
         try:
             local_pdf_path = pdf_path
 
-            # ✅ If URL → download to temp file
-            if pdf_path.startswith("http://") or pdf_path.startswith("https://"):
-                response = requests.get(pdf_path, timeout=30)
-                response.raise_for_status()
-
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(response.content)
-                    local_pdf_path = tmp.name
+            # ✅ If URL → streamed into the download cache (reused when unchanged)
+            if is_url(pdf_path):
+                local_pdf_path = fetch_pdf(pdf_path)
 
             # ✅ Validate local file
             if not os.path.exists(local_pdf_path):
                 return f"❌ Error: PDF could not be accessed."
 
-            # Initialize PDFSearchTool with LOCAL file
-            pdf_tool = PDFSearchTool(pdf=local_pdf_path)
+            if mode != "search" or not query:
+                return extract_pdf_text(local_pdf_path)
 
-            if not query:
-                return "✅ PDF loaded successfully."
+            with open(local_pdf_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
 
-            result = pdf_tool.run(query)
+            result = _search_tool_for(local_pdf_path, digest).run(query)
             return f"📄 Query Result:\n{result}"
 
         except Exception as e:
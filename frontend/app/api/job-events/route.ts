@@ -0,0 +1,40 @@
+import { NextRequest, NextResponse } from "next/server";
+
+export const dynamic = "force-dynamic";
+
+export async function GET(req: NextRequest) {
+  const { searchParams } = new URL(req.url);
+  const jobId = searchParams.get("job_id");
+
+  if (!jobId) {
+    return NextResponse.json({ error: "Missing job_id" }, { status: 400 });
+  }
+
+  try {
+    const flaskUrl = `${process.env.NEXT_PUBLIC_FLASK_URL}/job-events?job_id=${jobId}`;
+
+    const resp = await fetch(flaskUrl, { cache: "no-store", signal: req.signal });
+
+    if (!resp.ok || !resp.body) {
+      const text = await resp.text();
+      return NextResponse.json(
+        { error: `Flask error: ${text}` },
+        { status: resp.status }
+      );
+    }
+
+    // pass the event stream straight through
+    return new Response(resp.body, {
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache, no-transform",
+        Connection: "keep-alive",
+      },
+    });
+  } catch (err: any) {
+    return NextResponse.json(
+      { error: err?.message || "Server error" },
+      { status: 500 }
+    );
+  }
+}
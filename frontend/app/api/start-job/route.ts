@@ -1,9 +1,21 @@
 import { NextResponse } from "next/server";
+import { createSupabaseServerClient } from "@/lib/supabase/server";
 
 const FLASK_BASE = process.env.FLASK_BASE || "http://localhost:5000";
+// shared with Flask; only requests carrying it may name the user
+const API_PROXY_SECRET = process.env.API_PROXY_SECRET || "";
 
 export async function POST(req: Request) {
   try {
+    const supabase = await createSupabaseServerClient();
+    const {
+      data: { user },
+    } = await supabase.auth.getUser();
+
+    if (!user) {
+      return NextResponse.json({ error: "Unauthorized" }, { status: 401 });
+    }
+
     const { pdf_url, text } = await req.json();
 
     if (!pdf_url || text === undefined) {
@@ -13,9 +25,15 @@ export async function POST(req: Request) {
       );
     }
 
+    // Flask schedules jobs fairly per user; the id comes from the session,
+    // never from the browser
     const resp = await fetch(`${FLASK_BASE}/start-job`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        "X-Proxy-Secret": API_PROXY_SECRET,
+        "X-User-Id": user.id,
+      },
       body: JSON.stringify({ pdf_url, text }),
     });
 
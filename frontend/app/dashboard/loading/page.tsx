@@ -15,48 +15,70 @@ export default function LoadingPage() {
       return;
     }
 
-    const pollInterval = setInterval(async () => {
-      try {
-        const resp = await fetch(`/api/job-status?job_id=${jobId}`);
-        const data = await resp.json();
+    let events: EventSource | null = null;
+    let pollInterval: ReturnType<typeof setInterval> | undefined;
 
-        // Status states returned by Flask
-        if (data.status === "queued" || data.status === "running") {
-          return; // keep waiting
-        }
+    const stop = () => {
+      events?.close();
+      clearInterval(pollInterval);
+    };
 
-        clearInterval(pollInterval);
+    const handleStatus = (data: any) => {
+      // Status states returned by Flask
+      if (data.status === "queued" || data.status === "running") {
+        return; // keep waiting
+      }
 
-        // Completed successfully
-        if (data.status === "completed") {
-          sessionStorage.setItem("tailoredResult", JSON.stringify(data));
-          router.push("/dashboard/result");
-        }
+      stop();
 
-        // Failure
-        if (data.status === "failed") {
-          sessionStorage.setItem(
-            "resultError",
-            JSON.stringify(data.payload || data)
-          );
-          router.push("/dashboard/result");
-        }
-      } catch (err: any) {
-        clearInterval(pollInterval);
-        sessionStorage.setItem("resultError", err.message || "Server error");
+      // Completed successfully
+      if (data.status === "completed") {
+        sessionStorage.setItem("tailoredResult", JSON.stringify(data));
         router.push("/dashboard/result");
       }
-    }, 3000); // poll every 3 seconds
+
+      // Failure
+      if (data.status === "failed" || data.status === "unknown") {
+        sessionStorage.setItem(
+          "resultError",
+          JSON.stringify(data.payload || data)
+        );
+        router.push("/dashboard/result");
+      }
+    };
+
+    const startPolling = () => {
+      pollInterval = setInterval(async () => {
+        try {
+          const resp = await fetch(`/api/job-status?job_id=${jobId}`);
+          handleStatus(await resp.json());
+        } catch (err: any) {
+          stop();
+          sessionStorage.setItem("resultError", err.message || "Server error");
+          router.push("/dashboard/result");
+        }
+      }, 3000); // poll every 3 seconds
+    };
+
+    // Push updates over SSE; fall back to polling if the stream drops
+    events = new EventSource(`/api/job-events?job_id=${jobId}`);
+    events.onmessage = (event) => {
+      handleStatus(JSON.parse(event.data));
+    };
+    events.onerror = () => {
+      events?.close();
+      if (!pollInterval) startPolling();
+    };
 
     // Hard timeout after 5 mins
     const timeout = setTimeout(() => {
-      clearInterval(pollInterval);
+      stop();
       sessionStorage.setItem("resultError", "Job timeout");
       router.push("/dashboard/result");
     }, 300000);
 
     return () => {
-      clearInterval(pollInterval);
+      stop();
       clearTimeout(timeout);
     };
   }, [router]);